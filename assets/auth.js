@@ -0,0 +1,270 @@
+// ページはAPIと同じFlaskアプリから配信されるため、同一オリジンの相対パスを使用
+// (別ホストから配信する場合のみ "https://your-public-server.com" のように設定)
+const serverUrl = "";
+let checkInterval;
+let revocationTimer;
+let revocationWatching = false;
+let confettiPromise;
+
+// 紙吹雪スクリプトは認証成功時に初めて読み込む (初期表示をブロックしない)
+function loadConfetti() {
+  if (!confettiPromise) {
+    confettiPromise = new Promise((resolve, reject) => {
+      const script = document.createElement("script");
+      script.src = document.body.dataset.confettiSrc;
+      script.async = true;
+      script.onload = () => resolve(window.confetti);
+      script.onerror = reject;
+      document.head.appendChild(script);
+    });
+  }
+  return confettiPromise;
+}
+
+// 認証成功後も定期的に確認し、管理者に取り消されたら認証画面に戻す
+// (取り消しを30秒以内に反映できる範囲で間隔を延ばし、タブが非表示の間は確認を止めて負荷を抑える)
+const REVOCATION_BASE_DELAY = 15000;
+const REVOCATION_MAX_DELAY = 30000;
+let revocationDelay = REVOCATION_BASE_DELAY;
+let revocationChecking = false;
+
+function scheduleRevocationCheck() {
+  clearTimeout(revocationTimer);
+  revocationTimer = null;
+  if (!revocationWatching || document.hidden) {
+    return;
+  }
+  revocationTimer = setTimeout(watchRevocation, revocationDelay);
+}
+
+async function watchRevocation() {
+  // 確認中に再表示された場合などに二重に確認しない
+  if (revocationChecking) {
+    return;
+  }
+  revocationChecking = true;
+  try {
+    const response = await fetch(serverUrl + "/check_auth");
+    if (response.ok) {
+      const data = await response.json();
+      if (!data.authenticated) {
+        revocationWatching = false;
+        location.reload();
+        return;
+      }
+    }
+  } catch (error) {
+    // 一時的な通信エラー・503は次回の確認に任せる
+  } finally {
+    revocationChecking = false;
+  }
+  revocationDelay = Math.min(revocationDelay * 2, REVOCATION_MAX_DELAY);
+  scheduleRevocationCheck();
+}
+
+function startRevocationWatch() {
+  revocationWatching = true;
+  revocationDelay = REVOCATION_BASE_DELAY;
+  scheduleRevocationCheck();
+}
+
+// タブが再表示されたら即座に確認し、間隔を初期値に戻す
+document.addEventListener("visibilitychange", () => {
+  if (!revocationWatching) {
+    return;
+  }
+  if (document.hidden) {
+    scheduleRevocationCheck();
+  } else {
+    revocationDelay = REVOCATION_BASE_DELAY;
+    clearTimeout(revocationTimer);
+    watchRevocation();
+  }
+});
+
+// JavaScript (認証コード生成/チェックロジック、テーマ管理)
+async function generateAuthId() {
+  const idSpan = document.getElementById("generated-id");
+  const copyButton = document.getElementById("copy-id-button");
+
+  idSpan.textContent = "コード発行中...";
+  copyButton.disabled = true;
+  document.getElementById("id-status").textContent = "...";
+
+  try {
+    const response = await fetch(serverUrl + "/generate_id");
+    const data = await response.json();
+
+    if (data.status === "authenticated") {
+      checkAuthentication(true); 
+      return;
+    }
+
+    if (data.auth_id) {
+      idSpan.textContent = data.auth_id;
+      idSpan.dataset.code = data.auth_id;
+      document.getElementById("id-status").textContent = "✅ 発行済 (5分間有効)";
+      copyButton.disabled = false;
+    } else {
+      idSpan.textContent = "発行失敗";
+      document.getElementById("id-status").textContent = "❌ 失敗";
+    }
+  } catch (error) {
+    idSpan.textContent = "サーバーエラー";
+    document.getElementById("id-status").textContent = "❌ 失敗";
+  }
+}
+
+function copyIdToClipboard() {
+  const id = document.getElementById("generated-id").dataset.code;
+  if (id) {
+    navigator.clipboard
+      .writeText(id)
+      .then(() => {
+        const button = document.getElementById("copy-id-button");
+        const originalText = button.textContent;
+        button.textContent = "✅ コピー完了！";
+        setTimeout(() => {
+          button.textContent = originalText;
+        }, 1500);
+      })
+      .catch((err) => {
+        alert("コピーに失敗しました: " + err);
+      });
+  }
+}
+document
+  .getElementById("copy-id-button")
+  .addEventListener("click", copyIdToClipboard);
+
+async function checkAuthentication(forceContentLoad = false) {
+  const authScreen = document.getElementById("auth-screen");
+  const authContent = document.getElementById("authenticated-content");
+  const authTitle = document.getElementById("auth-title");
+  const authMessage = document.getElementById("auth-message");
+  const iconWrapper = document.getElementById("icon-wrapper");
+
+  if (!forceContentLoad) {
+    authMessage.innerHTML = '状態を確認中...';
+  }
+
+  try {
+    const authResponse = await fetch(serverUrl + "/check_auth");
+    const authData = await authResponse.json();
+
+    if (authData.authenticated) {
+      // --- 認証成功フロー ---
+      clearInterval(checkInterval);
+
+      authTitle.textContent = "🎉 認証成功！";
+      authMessage.textContent = "更新版コンテンツを読み込みます...";
+      document.getElementById("dynamic-flow").style.display = "none";
+      iconWrapper.style.opacity = 1;
+
+      // 成功アニメーション
+      iconWrapper.innerHTML = `
+          <svg class="success-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 52 52" aria-hidden="true">
+              <circle class="success-icon__circle" cx="26" cy="26" r="24" fill="none"/>
+              <path class="success-icon__check" fill="none" d="M14.1 27.2l7.1 7.2 16.7-16.8"/>
+          </svg>
+      `;
+      loadConfetti()
+      .then((confetti) => confetti({ particleCount: 150, spread: 80, origin: { y: 0.6 }, colors: ["#00f5ff", "#0d6efd", "#f8f9fa", "#6c757d"], }))
+      .catch(() => {});
+
+      await new Promise((resolve) => setTimeout(resolve, 1500));
+
+      // 更新版コンテンツをロード
+      const contentResponse = await fetch(serverUrl + "/authenticated_content");
+
+      if (contentResponse.ok) {
+        const contentHtml = await contentResponse.text();
+
+        authScreen.style.display = "none";
+        authContent.innerHTML = contentHtml;
+        authContent.style.display = "block";
+
+        startRevocationWatch();
+      } else {
+        authTitle.textContent = "❌ コンテンツ読み込み失敗";
+        authMessage.textContent = `エラーコード: ${contentResponse.status}。サーバーのコンテンツ設定を確認してください。`;
+        iconWrapper.innerHTML = `
+          <svg class="error-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 52 52" aria-hidden="true">
+              <circle class="error-icon__circle" cx="26" cy="26" r="24" fill="none" style="stroke-dashoffset:0;"/>
+              <path class="error-icon__cross" fill="none" d="M16 16 36 36 M36 16 16 36" style="stroke-dashoffset:0; stroke:url(#grad-error)"/>
+          </svg>
+        `;
+      }
+    } else {
+      // --- 未認証フロー ---
+      authScreen.style.display = "block";
+      authContent.style.display = "none";
+
+      authTitle.textContent = "IPアドレス認証が必要です 🔐";
+      authMessage.textContent = "Discordでの承認をお待ちください。";
+      document.getElementById("dynamic-flow").style.display = "block";
+      iconWrapper.innerHTML = '';
+      iconWrapper.style.opacity = 0;
+
+      if (
+        !document.getElementById("generated-id").dataset.code ||
+        document.getElementById("id-status").textContent.includes("失敗")
+      ) {
+        generateAuthId();
+      }
+    }
+  } catch (error) {
+    authTitle.textContent = "🚨 サーバーエラー";
+    authMessage.textContent = "サーバーに接続できません。`serverUrl`の設定またはサーバーの状態を確認してください。";
+    iconWrapper.innerHTML = `
+          <svg class="error-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 52 52" aria-hidden="true">
+              <circle class="error-icon__circle" cx="26" cy="26" r="24" fill="none" style="stroke-dashoffset:0;"/>
+              <path class="error-icon__cross" fill="none" d="M16 16 36 36 M36 16 16 36" style="stroke-dashoffset:0; stroke:url(#grad-error)"/>
+          </svg>
+      `;
+      iconWrapper.style.opacity = 1;
+  }
+}
+
+// テーママネージャー
+class ThemeManager {
+  constructor() {
+    this.checkbox = document.querySelector("#checkbox");
+    this.initializeTheme();
+    this.setupEventListeners();
+  }
+  initializeTheme() {
+    const prefersDark = window.matchMedia("(prefers-color-scheme: dark)");
+    const savedTheme = localStorage.getItem("theme");
+    if (savedTheme) {
+      document.documentElement.setAttribute("data-theme", savedTheme);
+      this.checkbox.checked = savedTheme === "dark";
+    } else {
+      const theme = prefersDark.matches ? "dark" : "light";
+      document.documentElement.setAttribute("data-theme", theme);
+      this.checkbox.checked = prefersDark.matches;
+    }
+  }
+  setupEventListeners() {
+    this.checkbox.addEventListener("change", () => {
+      const theme = this.checkbox.checked ? "dark" : "light";
+      document.documentElement.setAttribute("data-theme", theme);
+      localStorage.setItem("theme", theme);
+    });
+    window
+      .matchMedia("(prefers-color-scheme: dark)")
+      .addEventListener("change", (e) => {
+        if (!localStorage.getItem("theme")) {
+          const theme = e.matches ? "dark" : "light";
+          document.documentElement.setAttribute("data-theme", theme);
+          this.checkbox.checked = e.matches;
+        }
+      });
+  }
+}
+new ThemeManager();
+
+// 初回実行と3秒ごとの認証状態チェック
+// (deferで読み込むためDOM構築後に実行される。フォント等の読み込み完了は待たない)
+checkAuthentication();
+checkInterval = setInterval(checkAuthentication, 3000);
@@ -0,0 +1,89 @@
+"""一括取り消し (revoke_auth) 中の /check_auth への影響を計測するベンチマーク
+
+一時ディレクトリのSQLiteに承認済みレコードを用意し、10万件を1トランザクションで取り消す間、
+別スレッドから残りのIPに対して check_auth_status を呼び続けてレイテンシを記録します。
+
+使い方: python benchmarks/bench_revoke.py [--rows 120000] [--revoke 100000]
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import datetime
+import tempfile
+import threading
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def populate(rows, revoke):
+    """rows件の承認済みレコードを作成 (先頭revoke件は承認者 'bench-revoke')"""
+    now = datetime.datetime.now()
+    expires_at = (now + datetime.timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+    approved_at = now.strftime('%Y-%m-%d %H:%M:%S')
+    with sqlite3.connect(main.DATABASE_FILE) as conn:
+        conn.executemany(
+            "INSERT INTO auth_data (ip_address, auth_id, is_authenticated, expires_at, approved_by, approved_at)"
+            " VALUES (?, ?, 1, ?, ?, ?)",
+            (
+                (f"ip-{i}", f"C{i:07d}", expires_at, 'bench-revoke' if i < revoke else 'bench-keep', approved_at)
+                for i in range(rows)
+            ),
+        )
+    main.init_db()
+
+
+def poll(ips, latencies, stop):
+    """取り消し対象外のIPに対して認証チェックを繰り返す (Webリクエストの代わり)"""
+    i = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        assert main.check_auth_status(ips[i % len(ips)])
+        latencies.append(time.perf_counter() - started)
+        i += 1
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=120000)
+    parser.add_argument('--revoke', type=int, default=100000)
+    parser.add_argument('--pollers', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        main.DATABASE_FILE = os.path.join(tmp, 'ip_auth.db')
+        main.init_db()
+        populate(args.rows, args.revoke)
+
+        ips = [f"ip-{i}" for i in range(args.revoke, args.rows)]
+        latencies = []
+        stop = threading.Event()
+        pollers = [threading.Thread(target=poll, args=(ips, latencies, stop)) for _ in range(args.pollers)]
+        for thread in pollers:
+            thread.start()
+        time.sleep(0.2)
+
+        started = time.perf_counter()
+        revoked = main.revoke_auth(approved_by='bench-revoke')
+        elapsed = time.perf_counter() - started
+
+        time.sleep(0.2)
+        stop.set()
+        for thread in pollers:
+            thread.join()
+
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    print(f"revoked {revoked:,} of {args.rows:,} rows in {elapsed * 1000:,.0f}ms")
+    print(
+        f"check_auth_status x{len(ms):,} ({args.pollers} threads): "
+        f"p50 {statistics.median(ms):.2f}ms, p99 {ms[int(len(ms) * 0.99)]:.2f}ms, max {ms[-1]:.2f}ms"
+    )
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,297 @@
+"""認証ページのフロントエンドアセットをビルドする
+
+assets/ (正本のHTML/CSS/JS) から以下を生成します。
+  - static/dist/   : minify + フィンガープリント付きのCSS/JS/フォント (immutableキャッシュで配信)
+  - static/index.html    : アセットURLを書き換えたminify済みの認証ページ
+  - static/manifest.json : 論理名 -> 出力ファイル名の対応表
+
+外部アセット (canvas-confetti, Noto Sans JP) は初回に assets/vendor/ へダウンロードして自己ホストします。
+取得・生成できなかったアセットは、ソースと同じく外部CDNの参照のまま残します (未ビルド時もページは動作します)。
+minify (rjsmin/rcssmin) とフォントのサブセット化 (fontTools) には pip install -r requirements-build.txt が必要です。
+
+使い方: python build_assets.py
+"""
+import os
+import re
+import ast
+import io
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import urllib.request
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+# fontToolsのサブセット処理の詳細ログは抑制
+logging.getLogger('fontTools').setLevel(logging.WARNING)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(BASE_DIR, 'assets')
+VENDOR_DIR = os.path.join(SOURCE_DIR, 'vendor')
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+
+# 自己ホストする外部アセット (assets/vendor/ に保存。URLはソースのHTMLの参照と一致させる)
+CONFETTI_URL = 'https://cdn.jsdelivr.net/npm/canvas-confetti@1.3.2/dist/confetti.browser.min.js'
+CONFETTI_FILE = os.path.join(VENDOR_DIR, 'confetti.js')
+FONT_URL = 'https://github.com/google/fonts/raw/main/ofl/notosansjp/NotoSansJP%5Bwght%5D.ttf'
+FONT_SOURCE_FILE = os.path.join(VENDOR_DIR, 'NotoSansJP[wght].ttf')
+# ページで使うウェイトの範囲 (可変フォントをこの範囲に絞る)
+FONT_WEIGHT_RANGE = (400, 800)
+# ソースのHTMLが未ビルド時に読み込むGoogle Fontsの参照 (自己ホスト版のpreloadに置き換える)
+FONT_CDN_LINKS = (
+    '<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin />',
+    '<link rel="stylesheet" href="https://fonts.googleapis.com/css2?family=Noto+Sans+JP:wght@400;700;800&display=swap" />',
+)
+FONT_FACE_CSS = (
+    '@font-face{font-family:"Noto Sans JP";font-style:normal;font-weight:%d %d;'
+    'font-display:swap;src:url("%s") format("woff2")}'
+)
+
+# サブセットに含める文字を集めるソース (コメントを除いたページのHTML/CSS/JS + main.py内の認証後コンテンツ)
+# main.py全体を対象にするとログやDiscord向けの文言の文字までフォントに含まれるため、変数の値だけを読む
+FONT_TEXT_MAIN_FILE = os.path.join(BASE_DIR, 'main.py')
+FONT_TEXT_MAIN_VARIABLE = 'AUTHENTICATED_CONTENT_HTML'
+
+# 初期表示時間の見積もりに使うネットワーク条件 (Lighthouseの低速4G相当)
+RTT_MS = 150
+BANDWIDTH_BYTES_PER_MS = 1.6 * 1024 * 1024 / 8 / 1000
+# 新しいオリジンへの接続確立 (DNS + TCP + TLS) に必要な往復回数
+NEW_ORIGIN_RTTS = 3
+
+
+def read_text(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def gzip_size(data):
+    return len(gzip.compress(data, compresslevel=9))
+
+
+def fingerprint(name, data):
+    """内容のハッシュをファイル名に埋め込む (例: auth.css -> auth.1a2b3c4d.css)"""
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    base, ext = os.path.splitext(os.path.basename(name))
+    return f"{base}.{digest}{ext}"
+
+
+def download(url, path):
+    """未取得の外部アセットをダウンロード (取得できなければFalse)"""
+    if os.path.exists(path):
+        return True
+    logger.info(f"Downloading {url}")
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            data = response.read()
+    except OSError as e:
+        logger.warning(f"Could not download {url}: {e}")
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def minify_css(css):
+    """rcssminでminify (未導入ならそのまま返す)"""
+    try:
+        import rcssmin
+    except ImportError:
+        logger.warning("rcssmin is not installed. CSS is not minified (pip install -r requirements-build.txt).")
+        return css
+    return rcssmin.cssmin(css)
+
+
+def minify_js(js):
+    """rjsminでminify (未導入ならそのまま返す)"""
+    try:
+        import rjsmin
+    except ImportError:
+        logger.warning("rjsmin is not installed. JS is not minified (pip install -r requirements-build.txt).")
+        return js
+    return rjsmin.jsmin(js)
+
+
+def minify_html(html):
+    """改行を含む空白の連続を改行1つに詰める
+
+    pre/textarea/script/style の外では空白の連続は描画上1つの空白と同じため、表示は変わらない。
+    タグ間の空白を完全に消すとインライン要素の間隔が変わるため行わない。
+    """
+    if re.search(r'<(pre|textarea|script|style)\b[^>]*>(?!</)', html):
+        raise ValueError("minify_html does not support inline <pre>, <textarea>, <script> or <style> content.")
+    html = re.sub(r'<!--.*?-->', '', html, flags=re.S)
+    html = re.sub(r'\s*\n\s*', '\n', html)
+    return html.strip() + '\n'
+
+
+def subset_font(chars):
+    """ページで使う文字だけを含むWOFF2を生成 (fontTools未導入なら None)"""
+    try:
+        from fontTools import subset
+        from fontTools.varLib import instancer
+    except ImportError:
+        logger.warning("fontTools is not installed. Skipping font subsetting (pip install -r requirements-build.txt).")
+        return None
+    if not download(FONT_URL, FONT_SOURCE_FILE):
+        return None
+
+    options = subset.Options()
+    options.flavor = 'woff2'
+    font = subset.load_font(FONT_SOURCE_FILE, options)
+    if 'fvar' in font:
+        font = instancer.instantiateVariableFont(font, {'wght': FONT_WEIGHT_RANGE})
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=chars)
+    subsetter.subset(font)
+    out = io.BytesIO()
+    subset.save_font(font, out, options)
+    return out.getvalue()
+
+
+def read_main_constant(path, name):
+    """main.py をimportせずに (Discord等の依存なしで) モジュール直下の文字列定数を読み出す"""
+    tree = ast.parse(read_text(path))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == name for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"{name} is not defined in {path}")
+
+
+def collect_font_text(html, css, js):
+    """サブセットに含める文字 (ASCII印字可能文字 + ページと認証後コンテンツ中の非ASCII文字)"""
+    content = read_main_constant(FONT_TEXT_MAIN_FILE, FONT_TEXT_MAIN_VARIABLE)
+    chars = {chr(c) for c in range(0x20, 0x7F)}
+    content = re.sub(r'<!--.*?-->', '', content, flags=re.S)
+    for text in (minify_html(html), minify_css(css), minify_js(js), content):
+        chars.update(ch for ch in text if ord(ch) > 0x7F)
+    return ''.join(sorted(chars))
+
+
+def write_atomic(path, text):
+    """配信中のサーバーが書きかけのファイルを読まないよう、一時ファイルから置き換える"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def build():
+    # 出力先を作り直す (古いフィンガープリントのファイルを残さない)
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+
+    manifest = {}
+    report = []
+
+    def emit(logical, data, raw_size):
+        name = fingerprint(logical, data)
+        with open(os.path.join(DIST_DIR, name), 'wb') as f:
+            f.write(data)
+        manifest[logical] = name
+        report.append((logical, name, raw_size, len(data), gzip_size(data)))
+
+    html_source = read_text(os.path.join(SOURCE_DIR, 'index.html'))
+    css_source = read_text(os.path.join(SOURCE_DIR, 'auth.css'))
+    js_source = read_text(os.path.join(SOURCE_DIR, 'auth.js'))
+
+    # 1. フォント (CSSから参照されるため先に生成)
+    font_text = collect_font_text(html_source, css_source, js_source)
+    font = subset_font(font_text)
+    if font is not None:
+        emit('vendor/noto-sans-jp.woff2', font, os.path.getsize(FONT_SOURCE_FILE))
+        logger.info(f"Font subset to {len(font_text)} characters.")
+
+    # 2. CSS (自己ホスト版フォントを生成できた場合のみ @font-face を追加)
+    css = minify_css(css_source)
+    if 'vendor/noto-sans-jp.woff2' in manifest:
+        css = FONT_FACE_CSS % (*FONT_WEIGHT_RANGE, manifest['vendor/noto-sans-jp.woff2']) + css
+    emit('auth.css', css.encode('utf-8'), len(css_source.encode('utf-8')))
+
+    # 3. JS
+    emit('auth.js', minify_js(js_source).encode('utf-8'), len(js_source.encode('utf-8')))
+
+    # 4. 紙吹雪 (配布元で minify 済み。成功時にのみ遅延読み込みされる)
+    if download(CONFETTI_URL, CONFETTI_FILE):
+        with open(CONFETTI_FILE, 'rb') as f:
+            confetti = f.read()
+        emit('vendor/confetti.js', confetti, len(confetti))
+
+    # 5. HTML (アセットURLを書き換えて static/ に出力。HTML自体はキャッシュさせない)
+    html = html_source
+    if 'vendor/noto-sans-jp.woff2' in manifest:
+        font_url = f"/assets/{manifest['vendor/noto-sans-jp.woff2']}"
+        html = html.replace(FONT_CDN_LINKS[0], '')
+        html = html.replace(
+            FONT_CDN_LINKS[1],
+            f'<link rel="preload" href="{font_url}" as="font" type="font/woff2" crossorigin />'
+        )
+    if 'vendor/confetti.js' in manifest:
+        html = html.replace(f'"{CONFETTI_URL}"', f'"/assets/{manifest["vendor/confetti.js"]}"')
+    for logical in ('auth.css', 'auth.js'):
+        html = html.replace(f'"/assets/{logical}"', f'"/assets/{manifest[logical]}"')
+    html = minify_html(html)
+    write_atomic(os.path.join(STATIC_DIR, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True))
+    # index.html は最後に置き換える (存在すればビルド済みとして配信されるため)
+    write_atomic(os.path.join(STATIC_DIR, 'index.html'), html)
+
+    html_bytes = html.encode('utf-8')
+    report.insert(0, ('index.html', 'index.html', len(html_source.encode('utf-8')), len(html_bytes), gzip_size(html_bytes)))
+    print_report(report, html_source, css_source, js_source)
+
+
+def transfer_ms(size):
+    return size / BANDWIDTH_BYTES_PER_MS
+
+
+def print_report(report, html_source, css_source, js_source):
+    """ページ重量と、初期表示までの時間の見積もりを表示"""
+    print()
+    print(f"{'asset':<28} {'output':<36} {'source':>10} {'minified':>10} {'gzip':>10}")
+    for logical, name, raw, minified, gzipped in report:
+        print(f"{logical:<28} {name:<36} {raw:>10,} {minified:>10,} {gzipped:>10,}")
+
+    # minifyの効果 (フィンガープリント前の自前のHTML/CSS/JSのみ。外部配布物は対象外)
+    own = [row for row in report if row[0] in ('index.html', 'auth.css', 'auth.js')]
+    own_source = sum(raw for _, _, raw, _, _ in own)
+    own_minified = sum(minified for _, _, _, minified, _ in own)
+    print(f"Minified HTML/CSS/JS: {own_source:,} -> {own_minified:,} bytes ({1 - own_minified / own_source:.1%} smaller)")
+
+    sizes = {logical: gzipped for logical, _, _, _, gzipped in report}
+
+    # 旧構成: CSS/JSをインラインで含むHTML -> jsDelivrの同期スクリプト -> Google Fontsの@import の直列
+    # (Google FontsのCSSサイズは不明なため0として扱い、見積もりは下限値)
+    legacy_html = gzip_size((html_source + css_source + js_source).encode('utf-8'))
+    legacy_confetti = sizes.get('vendor/confetti.js', 0)
+    legacy_ms = (
+        RTT_MS + transfer_ms(legacy_html)
+        + (NEW_ORIGIN_RTTS + 1) * RTT_MS + transfer_ms(legacy_confetti)
+        + (NEW_ORIGIN_RTTS + 1) * RTT_MS
+    )
+    legacy_bytes = legacy_html + legacy_confetti
+
+    # 新構成: HTML -> 同一オリジンのCSS (JSはdefer、フォントはswap、紙吹雪は成功時のみ)
+    critical_bytes = sizes['index.html'] + sizes['auth.css']
+    css_ms = RTT_MS + transfer_ms(sizes['auth.css'])
+    if 'vendor/noto-sans-jp.woff2' not in sizes:
+        # フォントを自己ホストできなかった場合はGoogle FontsのCSSも並行して読み込む (サイズ不明のため接続時間のみ)
+        css_ms = max(css_ms, (NEW_ORIGIN_RTTS + 1) * RTT_MS)
+    new_ms = RTT_MS + transfer_ms(sizes['index.html']) + css_ms
+    initial_bytes = sum(size for logical, size in sizes.items() if logical != 'vendor/confetti.js')
+
+    print()
+    mbps = BANDWIDTH_BYTES_PER_MS * 8 * 1000 / 1024 / 1024
+    print(f"Network model: RTT {RTT_MS}ms, {mbps:.1f}Mbps, new origin +{NEW_ORIGIN_RTTS} RTT")
+    print(f"Legacy render-blocking bytes (gzip, lower bound): {legacy_bytes:,}")
+    print(f"Legacy estimated time to first render (lower bound): {legacy_ms:,.0f}ms")
+    print(f"Render-blocking bytes (gzip): {critical_bytes:,}")
+    print(f"Initial page weight excl. lazy confetti (gzip): {initial_bytes:,}")
+    print(f"Estimated time to first render: {new_ms:,.0f}ms")
+
+
+if __name__ == '__main__':
+    sys.exit(build())
@@ -7,17 +7,27 @@ import asyncio
 import threading
 import logging
 import time # 💡【重要】 timeモジュールをインポート
+import json
+import hashlib
+import collections
+import functools
+import cProfile
+import pstats
+import io
+import sys
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 
 # Discord
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands, Embed, Interaction, ui, ButtonStyle
 
 # Flask
-from waitress import serve
-from flask import Flask, request, jsonify, render_template_string
-from waitress import serve 
+from flask import Flask, request, jsonify, send_from_directory
+from waitress.server import create_server
+from waitress.task import ThreadedTaskDispatcher
+from waitress.utilities import Error as WaitressError
 
 # ==============================================================================
 # 1. 初期設定とグローバル変数
@@ -37,8 +47,50 @@ DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 # Renderのエフェメラル環境に対応するため、相対パスを使用
 DATABASE_FILE = 'ip_auth.db'
 
-# SQLiteの排他制御のためのスレッドロック (FlaskとBotの同時アクセス対策)
-DB_LOCK = threading.Lock()
+# Bot再接続スーパーバイザーの設定 (秒。環境変数で上書き可能)
+BOT_RETRY_BASE_DELAY = float(os.getenv('BOT_RETRY_BASE_DELAY', '5'))
+BOT_RETRY_MAX_DELAY = float(os.getenv('BOT_RETRY_MAX_DELAY', '600'))
+BOT_CIRCUIT_THRESHOLD = int(os.getenv('BOT_CIRCUIT_THRESHOLD', '6'))
+BOT_CIRCUIT_COOLDOWN = float(os.getenv('BOT_CIRCUIT_COOLDOWN', '1800'))
+
+# Waitress (Webサーバー) の設定 (環境変数で上書き可能)
+WEB_THREADS = int(os.getenv('WEB_THREADS', '8'))
+WEB_CONNECTION_LIMIT = int(os.getenv('WEB_CONNECTION_LIMIT', '100'))
+WEB_CHANNEL_TIMEOUT = int(os.getenv('WEB_CHANNEL_TIMEOUT', '30'))
+# 処理待ちキューの上限。超えた分は即座に503を返す
+WEB_MAX_QUEUE = int(os.getenv('WEB_MAX_QUEUE', '32'))
+# キューの先頭に割り込ませる優先パス (ポーリング中の認証チェック)
+WEB_PRIORITY_PATHS = ('/check_auth',)
+# 優先リクエスト用の処理待ち上限 (通常キューとは別枠。超えた分は優先パスでも503)
+WEB_MAX_PRIORITY_QUEUE = int(os.getenv('WEB_MAX_PRIORITY_QUEUE', '64'))
+# 503を返した件数をまとめてログに出す間隔 (秒)
+WEB_SHED_LOG_INTERVAL = float(os.getenv('WEB_SHED_LOG_INTERVAL', '10'))
+
+# 起動時に認証ページのアセットが未ビルドなら、バックグラウンドで build_assets.py を実行する
+# (ビルド完了まではソースのページ (外部CDN参照) を配信する)
+BUILD_ASSETS_ON_START = os.getenv('BUILD_ASSETS_ON_START', '1') == '1'
+
+# 起動中のBot監視役 (run_botで設定。/metrics から復旧時間を参照する)
+BOT_SUPERVISOR = None
+
+# 管理用エンドポイントのトークン (未設定なら管理用エンドポイントは無効)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# 管理コマンドで入力・表示する日時のタイムゾーン (DBにはサーバーのローカル時刻で保存される)
+ADMIN_TIMEZONE = ZoneInfo(os.getenv('ADMIN_TIMEZONE', 'Asia/Tokyo'))
+
+# リクエストプロファイリング設定 (PROFILE_ENABLED=1 の時のみ有効)
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', '0') == '1'
+# cProfileで計測するリクエストの割合 (0.0〜1.0)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.01'))
+# この時間 (ミリ秒) を超えたリクエストのスタックを保存する
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '500'))
+# スタックサンプリングの間隔 (ミリ秒)
+# 間隔ごとに実行中の全リクエストのスタックを辿るため、GILを占有する時間は同時実行数に比例する
+# (深さ60程度のスタックで1リクエストあたり約75µs/回 = 5ms間隔で約1.5%)。負荷が高い場合は間隔を広げる
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+# 保存するプロファイルの件数 (リングバッファ)
+PROFILE_BUFFER_SIZE = int(os.getenv('PROFILE_BUFFER_SIZE', '20'))
 
 # 認証後のコンテンツ (更新版コンテンツ)
 AUTHENTICATED_CONTENT_HTML = """
@@ -62,402 +114,338 @@ AUTHENTICATED_CONTENT_HTML = """
           </center>
 """
 
-# HTMLテンプレート (CSSとJavaScriptを含む完全版)
-AUTH_HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="ja">
-  <head>
-    <meta charset="UTF-8" />
-    <title>IPアドレス認証</title>
-    <script
-      type="text/javascript"
-      src="https://cdn.jsdelivr.net/npm/canvas-confetti@1.3.2/dist/confetti.browser.min.js"
-    ></script>
-    <meta name="viewport" content="width=device-width,initial-scale=1" />
-    <style>
-/* --- CSS --- */
-@import url("https://fonts.googleapis.com/css2?family=Noto+Sans+JP:wght@400;700;800&display=swap");
-
-/* ====== Theme Tokens ====== */
-:root {
-  --bg-color: #f6f7fb; --bg-aurora-1: #b8d7ff; --bg-aurora-2: #ffe1f0; --bg-aurora-3: #d9fff1;
-  --card-bg: rgba(255, 255, 255, 0.65); --card-backdrop: blur(14px);
-  --primary-text: #1b1f24; --secondary-text: #5a6572;
-  --accent-color: #0d6efd; --accent-color-2: #00bcd4;
-  --error-color: #dc3545; --error-color-2: #ff6b7a;
-  --button-bg: #0d6efd; --button-hover-bg: #0b5ed7; 
-  --border-color: rgba(27, 31, 36, 0.06); --shadow-color: rgba(16, 24, 40, 0.08);
-  --radius: 20px; --transition-time: 0.45s; --icon-fill: #333333;
-}
-:root[data-theme="dark"] {
-  --bg-color: #0e1320; --bg-aurora-1: #2643a7; --bg-aurora-2: #7a2e7b; --bg-aurora-3: #0b6e6b;
-  --card-bg: rgba(26, 32, 56, 0.6); --card-backdrop: blur(16px);
-  --primary-text: #f4f6fb; --secondary-text: #c0c7d2;
-  --accent-color: #00f5ff; --accent-color-2: #5a8bff;
-  --error-color: #ff7b88; --error-color-2: #ffb3bd;
-  --button-bg: #00f5ff; --button-hover-bg: #00b0ff; 
-  --border-color: rgba(255, 255, 255, 0.06); --shadow-color: rgba(0, 0, 0, 0.25);
-  --icon-fill: #e1e1ff;
-}
-
-/* ====== Base / Card ====== */
-* { box-sizing: border-box; }
-html { font-family: "Noto Sans JP", system-ui, -apple-system, "Segoe UI", sans-serif; font-size: 15px; }
-body { margin: 0; min-height: 100vh; color: var(--primary-text); background: var(--bg-color); display: grid; place-items: center; overflow-x: hidden; transition: background-color var(--transition-time) ease; }
-body::before, body::after { content: ''; position: absolute; border-radius: 50%; filter: blur(120px); opacity: 0.4; z-index: -1; animation: auroraMove 40s infinite alternate; }
-body::before { top: 10%; left: 5%; width: 50vw; height: 50vh; background-color: var(--bg-aurora-1); }
-body::after { bottom: 10%; right: 5%; width: 40vw; height: 40vh; background-color: var(--bg-aurora-2); }
-#authenticated-content { display: none; width: 100%; height: 100vh; position: fixed; top: 0; left: 0; z-index: 100; background-color: var(--bg-color); }
-
-.container {
-  width: 100%; max-width: 350px; 
-  margin: 10px; padding: 25px 20px; 
-  background: var(--card-bg); backdrop-filter: var(--card-backdrop);
-  border-radius: var(--radius); position: relative; text-align: center;
-  box-shadow: 0 10px 40px var(--shadow-color), 0 1px 0 rgba(255,255,255,0.6) inset;
-  animation: popIn .6s cubic-bezier(.175,.885,.32,1.275) forwards; opacity: 0;
-}
-.illustration-wrapper { margin-bottom: 0.8rem; opacity: 0; min-height: 60px; }
-.success-icon, .error-icon { width: 60px; height: 60px; }
-
-/* ====== Text / Steps ====== */
-.title { font-size: 1.4rem; margin: 0 0 .5rem; opacity: 0; font-weight: 800; color: var(--accent-color); }
-.divider { height: 1px; width: 90%; margin: 8px auto 16px; background: var(--border-color); opacity: 1; }
-.message { font-size: 0.95rem; line-height: 1.6; margin: 0; }
-.auth-step { padding: 12px; border-radius: 10px; margin-bottom: 12px; border: 2px solid var(--border-color); text-align: left; background: rgba(255,255,255,0.4); }
-.step-title { font-weight: 800; font-size: 1.05rem; display: flex; justify-content: space-between; align-items: center; margin-bottom: 6px; color: var(--primary-text); }
-.message-small { font-size: 0.85rem; line-height: 1.4; margin: 0; color: var(--secondary-text); }
-#generated-id {
-    font-family: 'Consolas', monospace; font-size: 1.2rem; font-weight: bold; color: var(--accent-color);
-    background: rgba(0, 0, 0, 0.05); display: block; padding: 8px; border-radius: 6px; text-align: center;
-    letter-spacing: 2px; margin-bottom: 10px; border: 1px dashed var(--accent-color);
-}
-.step-button { 
-    padding: 8px 16px; font-size: 0.9rem; border-radius: 6px; width: 100%; 
-    border: none; background-color: var(--button-bg); color: #fff; cursor: pointer; font-weight: 700;
-    transition: background-color 0.2s ease;
-}
-.step-button:hover:not(:disabled) { background-color: var(--button-hover-bg); transform: translateY(-1px); }
-.step-button:disabled { background-color: #6c757d; cursor: not-allowed; opacity: 0.7; }
-#auth-message { margin-top: 15px; font-weight: 700; color: var(--primary-text); }
-
-
-/* ====== Footer / Theme Switch ====== */
-.page-footer { position: fixed; bottom: 8px; left: 50%; transform: translateX(-50%); font-size: .75rem; }
-.support-link { color: var(--secondary-text); padding: 2px 8px; border-radius: 12px; }
-.theme-switch-wrapper { position: fixed; bottom: 8px; right: 8px; }
-.theme-switch { position: relative; display: inline-block; width: 44px; height: 24px; }
-.slider { background-color: var(--switch-bg); border-radius: 34px; }
-.slider-icon { position: absolute; content: ""; height: 20px; width: 20px; left: 2px; bottom: 2px; background-color: var(--switch-slider); border-radius: 50%; transition: all var(--transition-time) cubic-bezier(.175,.885,.32,1.275); }
-.sun-icon, .moon-icon { position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); width: 12px; height: 12px; fill: var(--icon-fill); transition: opacity var(--transition-time); }
-.moon-icon { opacity: 0; }
-input:checked + .slider .slider-icon { transform: translateX(20px); }
-input:checked + .slider .sun-icon { opacity: 0; }
-input:checked + .slider .moon-icon { opacity: 1; }
-
-/* ====== Animations ====== */
-@keyframes popIn { from {opacity:0; transform:scale(.96)} to {opacity:1; transform:scale(1)} }
-@keyframes auroraMove { 0% {transform: translate(0, 0);} 50% {transform: translate(30%, 20%);} 100% {transform: translate(0, 0);} }
-@keyframes drawCircle { to { stroke-dashoffset: 0; } }
-@keyframes drawCheck { to { stroke-dashoffset: 0; } }
-@keyframes drawCross { to { stroke-dashoffset: 0; } }
-
-.success-icon__circle { stroke: url(#grad-success); stroke-dasharray: 150; stroke-dashoffset: 150; animation: drawCircle 1s ease-out forwards; }
-.success-icon__check { stroke: url(#grad-success); stroke-dasharray: 50; stroke-dashoffset: 50; animation: drawCheck 0.5s 0.8s ease-out forwards; }
-.error-icon__circle { stroke: url(#grad-error); stroke-dasharray: 150; stroke-dashoffset: 150; animation: drawCircle 1s ease-out forwards; }
-.error-icon__cross { stroke: url(#grad-error); stroke-dasharray: 40 40; stroke-dashoffset: 80; animation: drawCross 0.5s 0.8s ease-out forwards; }
-    </style>
-  </head>
-  <body>
-    <main class="container" id="auth-screen">
-      <div class="illustration-wrapper" id="icon-wrapper"></div>
-      <h1 class="title" id="auth-title">IPアドレス認証が必要です 🔐</h1>
-      <div class="divider" aria-hidden="true"></div>
-
-      <div id="dynamic-flow">
-        <div class="auth-step">
-          <div class="step-title">
-            1. 認証コードを発行
-            <span id="id-status">...</span>
-          </div>
-          <div class="step-content">
-            <span id="generated-id" data-code="">コード発行中...</span>
-            <button class="step-button" id="copy-id-button" disabled>
-              📋 コードをコピー
-            </button>
-          </div>
-        </div>
-
-        <div class="auth-step">
-          <div class="step-title">
-            2. Discordで承認
-            <span id="auth-status">未完了</span>
-          </div>
-          <p class="message-small">
-            このコードをコピーし、Discordチャンネルで<br />
-            **/認証コード承認** コマンドを実行し、**「認証コード入力」ボタン**からコードを入力してください。
-          </p>
-        </div>
-      </div>
-      <p class="message" id="auth-message">状態を確認しています...</p>
-    </main>
-    <div id="authenticated-content"></div>
-    
-    <footer class="page-footer">
-      <a href="https://discord.gg/ZuEvp5PKWA" class="support-link" target="_blank" rel="noopener noreferrer">
-        (サポートサーバー)
-      </a>
-    </footer>
-
-    <div class="theme-switch-wrapper" aria-label="テーマ切り替え">
-      <label class="theme-switch">
-        <input type="checkbox" id="checkbox" aria-label="ダークモード" />
-        <div class="slider">
-          <div class="slider-icon">
-             <svg class="sun-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" aria-hidden="true"><path d="M12 3a1 1 0 0 1 1 1v1a1 1 0 1 1-2 0V4a1 1 0 0 1 1-1zm7.07 3.93a1 1 0 0 1 0 1.414l-.707.707a1 1 0 1 1-1.414-1.414l.707-.707a1 1 0 0 1 1.414 0zM12 8a4 4 0 1 1 0 8 4 4 0 0 1 0-8zm-8.07-1.07a1 1 0 0 1 1.414 0l.707.707A1 1 0 1 1 4.636 9.05l-.707-.707a1 1 0 0 1 0-1.414zM4 12a1 1 0 0 1 1-1h1a1 1 0 1 1 0 2H5a1 1 0 0 1-1-1zm.636 5.95a1 1 0 0 1 0-1.414l.707-.707a1 1 0 0 1 1.414 1.414l-.707.707a1 1 0 0 1 0 1.414zM12 19a1 1 0 0 1 1 1v1a1 1 0 1 1-2 0v-1a1 1 0 0 1 1-1zm7.07-1.07a1 1 0 0 1-1.414 0l-.707-.707a1 1 0 0 1 1.414-1.414l.707.707a1 1 0 0 1 0 1.414zM20 12a1 1 0 0 1-1 1h-1a1 1 0 1 1 0-2h1a1 1 0 0 1 1 1z"/>
-             </svg>
-             <svg class="moon-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" aria-hidden="true"><path d="M12 3c.132 0 .263 0 .393 0a7.5 7.5 0 0 0 7.92 12.446a9 9 0 1 1 -8.313-12.454z"/></svg>
-          </div>
-        </div>
-      </label>
-    </div>
-
-    <svg style="position: absolute; width: 0; height: 0; overflow: hidden;" aria-hidden="true">
-      <defs>
-        <linearGradient id="grad-success" x1="0" y1="0" x2="1" y2="1">
-          <stop offset="0%" stop-color="var(--accent-color)" /><stop offset="100%" stop-color="var(--accent-color-2)" />
-        </linearGradient>
-        <path id="success-circle-path" d="M26 2c13.255 0 24 10.745 24 24s-10.745 24-24 24S2 39.255 2 26 12.745 2 26 2z"/>
-        <path id="success-check-path" d="M14.1 27.2l7.1 7.2 16.7-16.8" />
-        <linearGradient id="grad-error" x1="0" y1="0" x2="1" y2="1">
-          <stop offset="0%" stop-color="var(--error-color)" /><stop offset="100%" stop-color="var(--error-color-2)" />
-        </linearGradient>
-        <path id="error-circle-path" d="M26 2c13.255 0 24 10.745 24 24s-10.745 24-24 24S2 39.255 2 26 12.745 2 26 2z"/>
-        <path id="error-cross-path" d="M16 16 36 36 M36 16 16 36" />
-      </defs>
-    </svg>
-
-    <script>
-      // 🚨 サーバーの公開URLを設定してください (例: "https://your-public-server.com")
-      const serverUrl = "https://takaios-bot.onrender.com"; // ★★★ Renderの実際の公開URLに修正 ★★★
-      let checkInterval;
-
-      // JavaScript (認証コード生成/チェックロジック、テーマ管理)
-      async function generateAuthId() {
-        const idSpan = document.getElementById("generated-id");
-        const copyButton = document.getElementById("copy-id-button");
-
-        idSpan.textContent = "コード発行中...";
-        copyButton.disabled = true;
-        document.getElementById("id-status").textContent = "...";
-
-        try {
-          const response = await fetch(serverUrl + "/generate_id");
-          const data = await response.json();
-
-          if (data.status === "authenticated") {
-            checkAuthentication(true); 
-            return;
-          }
-
-          if (data.auth_id) {
-            idSpan.textContent = data.auth_id;
-            idSpan.dataset.code = data.auth_id;
-            document.getElementById("id-status").textContent = "✅ 発行済 (5分間有効)";
-            copyButton.disabled = false;
-          } else {
-            idSpan.textContent = "発行失敗";
-            document.getElementById("id-status").textContent = "❌ 失敗";
-          }
-        } catch (error) {
-          idSpan.textContent = "サーバーエラー";
-          document.getElementById("id-status").textContent = "❌ 失敗";
+# ==============================================================================
+# 2. リクエストプロファイリング (PROFILE_ENABLED=1 の時のみ有効)
+# ==============================================================================
+
+class RequestProfiler:
+    """区間タイマー、cProfileのサンプリング、遅いリクエストのスタック収集を行う"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 区間名 -> [回数, 合計秒, 最大秒]
+        self.timers = {}
+        # スレッドID -> 実行中リクエストの情報
+        self.active = {}
+        self.slow_requests = collections.deque(maxlen=PROFILE_BUFFER_SIZE)
+        self.sampled_profiles = collections.deque(maxlen=PROFILE_BUFFER_SIZE)
+        # cProfileは同時に1リクエストだけ計測する
+        self.cprofile_lock = threading.Lock()
+        self.sampler = None
+
+    def record(self, name, elapsed):
+        with self.lock:
+            stat = self.timers.get(name)
+            if stat is None:
+                self.timers[name] = [1, elapsed, elapsed]
+            else:
+                stat[0] += 1
+                stat[1] += elapsed
+                stat[2] = max(stat[2], elapsed)
+
+    def install(self, flask_app):
+        """Flaskにフックを登録し、スタックサンプラーを起動"""
+        flask_app.before_request(self.start_request)
+        flask_app.teardown_request(self.end_request)
+        self.sampler = threading.Thread(target=self.sample_stacks, name="Profiler-Sampler", daemon=True)
+        self.sampler.start()
+        logger.info(
+            f"Request profiling enabled (sample_rate={PROFILE_SAMPLE_RATE}, "
+            f"slow_ms={PROFILE_SLOW_MS}, interval_ms={PROFILE_INTERVAL_MS})"
+        )
+
+    def start_request(self):
+        # 管理者用のエンドポイント (/metrics, /admin/*) は計測しない
+        if request.path == '/metrics' or request.path.startswith('/admin/'):
+            return
+        entry = {
+            "path": request.path,
+            # 区間タイマーはルート単位で集計する (生のパスを使うと存在しないURLごとに項目が増え続ける)
+            "route": request.url_rule.rule if request.url_rule is not None else "<unmatched>",
+            "start": time.perf_counter(),
+            "stacks": collections.Counter(),
+            "profile": None,
         }
-      }
-
-      function copyIdToClipboard() {
-        const id = document.getElementById("generated-id").dataset.code;
-        if (id) {
-          navigator.clipboard
-            .writeText(id)
-            .then(() => {
-              const button = document.getElementById("copy-id-button");
-              const originalText = button.textContent;
-              button.textContent = "✅ コピー完了！";
-              setTimeout(() => {
-                button.textContent = originalText;
-              }, 1500);
+        if random.random() < PROFILE_SAMPLE_RATE and self.cprofile_lock.acquire(blocking=False):
+            entry["profile"] = cProfile.Profile()
+            entry["profile"].enable()
+        with self.lock:
+            self.active[threading.get_ident()] = entry
+
+    def end_request(self, exc=None):
+        with self.lock:
+            entry = self.active.pop(threading.get_ident(), None)
+            if entry is None:
+                return
+            # activeから外した時点のスタック集計を固定する (以降サンプラーは更新しない)
+            stacks = dict(entry["stacks"])
+        elapsed = time.perf_counter() - entry["start"]
+        self.record(f"request {entry['route']}", elapsed)
+        captured_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        if entry["profile"] is not None:
+            entry["profile"].disable()
+            self.cprofile_lock.release()
+            out = io.StringIO()
+            pstats.Stats(entry["profile"], stream=out).sort_stats('cumulative').print_stats(30)
+            self.sampled_profiles.append({
+                "path": entry["path"],
+                "duration_ms": elapsed * 1000,
+                "captured_at": captured_at,
+                "stats": out.getvalue(),
             })
-            .catch((err) => {
-              alert("コピーに失敗しました: " + err);
-            });
-        }
-      }
-      document
-        .getElementById("copy-id-button")
-        .addEventListener("click", copyIdToClipboard);
-
-      async function checkAuthentication(forceContentLoad = false) {
-        const authScreen = document.getElementById("auth-screen");
-        const authContent = document.getElementById("authenticated-content");
-        const authTitle = document.getElementById("auth-title");
-        const authMessage = document.getElementById("auth-message");
-        const iconWrapper = document.getElementById("icon-wrapper");
-
-        if (!forceContentLoad) {
-          authMessage.innerHTML = '状態を確認中...';
-        }
 
-        try {
-          const authResponse = await fetch(serverUrl + "/check_auth");
-          const authData = await authResponse.json();
-
-          if (authData.authenticated) {
-            // --- 認証成功フロー ---
-            clearInterval(checkInterval);
-
-            authTitle.textContent = "🎉 認証成功！";
-            authMessage.textContent = "更新版コンテンツを読み込みます...";
-            document.getElementById("dynamic-flow").style.display = "none";
-            iconWrapper.style.opacity = 1;
-
-            // 成功アニメーション
-            iconWrapper.innerHTML = `
-                <svg class="success-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 52 52" aria-hidden="true">
-                    <circle class="success-icon__circle" cx="26" cy="26" r="24" fill="none"/>
-                    <path class="success-icon__check" fill="none" d="M14.1 27.2l7.1 7.2 16.7-16.8"/>
-                </svg>
-            `;
-            confetti({ particleCount: 150, spread: 80, origin: { y: 0.6 }, colors: ["#00f5ff", "#0d6efd", "#f8f9fa", "#6c757d"], });
-
-            await new Promise((resolve) => setTimeout(resolve, 1500));
-
-            // 更新版コンテンツをロード
-            const contentResponse = await fetch(serverUrl + "/authenticated_content");
-
-            if (contentResponse.ok) {
-              const contentHtml = await contentResponse.text();
-
-              authScreen.style.display = "none";
-              authContent.innerHTML = contentHtml;
-              authContent.style.display = "block";
-            } else {
-              authTitle.textContent = "❌ コンテンツ読み込み失敗";
-              authMessage.textContent = `エラーコード: ${contentResponse.status}。サーバーのコンテンツ設定を確認してください。`;
-              iconWrapper.innerHTML = `
-                <svg class="error-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 52 52" aria-hidden="true">
-                    <circle class="error-icon__circle" cx="26" cy="26" r="24" fill="none" style="stroke-dashoffset:0;"/>
-                    <path class="error-icon__cross" fill="none" d="M16 16 36 36 M36 16 16 36" style="stroke-dashoffset:0; stroke:url(#grad-error)"/>
-                </svg>
-              `;
-            }
-          } else {
-            // --- 未認証フロー ---
-            authScreen.style.display = "block";
-            authContent.style.display = "none";
-            
-            authTitle.textContent = "IPアドレス認証が必要です 🔐";
-            authMessage.textContent = "Discordでの承認をお待ちください。";
-            document.getElementById("dynamic-flow").style.display = "block";
-            iconWrapper.innerHTML = '';
-            iconWrapper.style.opacity = 0;
-
-            if (
-              !document.getElementById("generated-id").dataset.code ||
-              document.getElementById("id-status").textContent.includes("失敗")
-            ) {
-              generateAuthId();
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            self.slow_requests.append({
+                "path": entry["path"],
+                "duration_ms": elapsed * 1000,
+                "captured_at": captured_at,
+                "stacks": stacks,
+            })
+            logger.warning(f"Slow request captured: {entry['path']} took {elapsed * 1000:.1f}ms")
+
+    def sample_stacks(self):
+        """実行中リクエストのスタックを一定間隔で採取 (collapsed-stack形式で集計)
+
+        コストは同時実行中のリクエスト数に比例する (PROFILE_INTERVAL_MS の説明を参照)。
+        """
+        interval = PROFILE_INTERVAL_MS / 1000
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                active = list(self.active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, entry in active:
+                frame = frames.get(thread_id)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                samples.append((thread_id, entry, ";".join(reversed(names))))
+            del frames
+            with self.lock:
+                for thread_id, entry, stack in samples:
+                    # スタックを辿っている間に終了したリクエストは集計済みのため更新しない
+                    if self.active.get(thread_id) is entry:
+                        entry["stacks"][stack] += 1
+
+    def collapsed(self):
+        """保存済みの遅いリクエストをflamegraph.pl互換のcollapsed-stack形式で返す"""
+        merged = collections.Counter()
+        for capture in list(self.slow_requests):
+            for stack, count in capture["stacks"].items():
+                merged[f"{capture['path']};{stack}"] += count
+        return "".join(f"{stack} {count}\n" for stack, count in merged.items())
+
+    def snapshot(self):
+        with self.lock:
+            timers = {
+                name: {"count": count, "total_ms": total * 1000, "avg_ms": total / count * 1000, "max_ms": peak * 1000}
+                for name, (count, total, peak) in self.timers.items()
             }
-          }
-        } catch (error) {
-          authTitle.textContent = "🚨 サーバーエラー";
-          authMessage.textContent = "サーバーに接続できません。`serverUrl`の設定またはサーバーの状態を確認してください。";
-          iconWrapper.innerHTML = `
-                <svg class="error-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 52 52" aria-hidden="true">
-                    <circle class="error-icon__circle" cx="26" cy="26" r="24" fill="none" style="stroke-dashoffset:0;"/>
-                    <path class="error-icon__cross" fill="none" d="M16 16 36 36 M36 16 16 36" style="stroke-dashoffset:0; stroke:url(#grad-error)"/>
-                </svg>
-            `;
-            iconWrapper.style.opacity = 1;
-        }
-      }
-
-      // テーママネージャー
-      class ThemeManager {
-        constructor() {
-          this.checkbox = document.querySelector("#checkbox");
-          this.initializeTheme();
-          this.setupEventListeners();
-        }
-        initializeTheme() {
-          const prefersDark = window.matchMedia("(prefers-color-scheme: dark)");
-          const savedTheme = localStorage.getItem("theme");
-          if (savedTheme) {
-            document.documentElement.setAttribute("data-theme", savedTheme);
-            this.checkbox.checked = savedTheme === "dark";
-          } else {
-            const theme = prefersDark.matches ? "dark" : "light";
-            document.documentElement.setAttribute("data-theme", theme);
-            this.checkbox.checked = prefersDark.matches;
-          }
-        }
-        setupEventListeners() {
-          this.checkbox.addEventListener("change", () => {
-            const theme = this.checkbox.checked ? "dark" : "light";
-            document.documentElement.setAttribute("data-theme", theme);
-            localStorage.setItem("theme", theme);
-          });
-          window
-            .matchMedia("(prefers-color-scheme: dark)")
-            .addEventListener("change", (e) => {
-              if (!localStorage.getItem("theme")) {
-                const theme = e.matches ? "dark" : "light";
-                document.documentElement.setAttribute("data-theme", theme);
-                this.checkbox.checked = e.matches;
-              }
-            });
+        return {
+            "enabled": PROFILE_ENABLED,
+            "timers": timers,
+            "slow_requests": [
+                {key: capture[key] for key in ("path", "duration_ms", "captured_at")}
+                for capture in list(self.slow_requests)
+            ],
+            "sampled_profiles": list(self.sampled_profiles),
         }
-      }
-      new ThemeManager();
-
-      // 初回実行と3秒ごとの認証状態チェック
-      window.onload = () => {
-          checkAuthentication();
-          checkInterval = setInterval(checkAuthentication, 3000);
-      };
-    </script>
-  </body>
-</html>
-"""
+
+PROFILER = RequestProfiler()
+
+def profiled(name):
+    """PROFILE_ENABLED時のみ処理時間を計測するデコレーター (無効時はそのまま返すためオーバーヘッドなし)"""
+    def decorator(func):
+        if not PROFILE_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PROFILER.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+class TimedLock:
+    """ロック取得までの待ち時間を計測するラッパー (プロファイリング時のみ使用)"""
+
+    def __init__(self, lock, name):
+        self.lock = lock
+        self.name = name
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        PROFILER.record(self.name, time.perf_counter() - start)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
 
 # ==============================================================================
-# 2. データベース操作関数 (スレッドセーフ化)
+# 3. データベース操作関数 (スレッドセーフ化)
 # ==============================================================================
+
+# SQLiteの排他制御のためのスレッドロック (FlaskとBotの同時アクセス対策)
+# generate_auth_id内からcheck_auth_statusを呼ぶため、再入可能なRLockを使用
+DB_LOCK = threading.RLock()
+if PROFILE_ENABLED:
+    # プロファイリング時はロック待ち時間を計測する
+    DB_LOCK = TimedLock(DB_LOCK, 'DB_LOCK wait')
+
+class AuthStats:
+    """認証コードの件数と毎分のレートをメモリ上で集計する (DBを読まずにO(1)で参照可能)"""
+    WINDOW_MINUTES = 60
+    EVENTS = ('generated', 'approved', 'expired', 'revoked')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.approved = 0
+        self.expired_total = 0
+        self.revoked_total = 0
+        # 固定長のリングバッファ: [分番号, {イベント: 件数}] を WINDOW_MINUTES 分だけ保持
+        self.buckets = [[-1, dict.fromkeys(self.EVENTS, 0)] for _ in range(self.WINDOW_MINUTES)]
+
+    def _bump(self, event, count):
+        minute = int(time.time() // 60)
+        bucket = self.buckets[minute % self.WINDOW_MINUTES]
+        if bucket[0] != minute:
+            bucket[0] = minute
+            bucket[1] = dict.fromkeys(self.EVENTS, 0)
+        bucket[1][event] += count
+
+    def seed(self, pending, approved):
+        """起動時にDBの現在値で初期化"""
+        with self.lock:
+            self.pending = pending
+            self.approved = approved
+
+    def record_generated(self, is_new):
+        with self.lock:
+            if is_new:
+                self.pending += 1
+            self._bump('generated', 1)
+
+    def record_approved(self, was_pending):
+        with self.lock:
+            if was_pending:
+                self.pending = max(0, self.pending - 1)
+                self.approved += 1
+            self._bump('approved', 1)
+
+    def record_expired(self, pending=0, approved=0):
+        if not pending and not approved:
+            return
+        with self.lock:
+            self.pending = max(0, self.pending - pending)
+            self.approved = max(0, self.approved - approved)
+            self.expired_total += pending + approved
+            self._bump('expired', pending + approved)
+
+    def record_revoked(self, pending=0, approved=0):
+        if not pending and not approved:
+            return
+        with self.lock:
+            self.pending = max(0, self.pending - pending)
+            self.approved = max(0, self.approved - approved)
+            self.revoked_total += pending + approved
+            self._bump('revoked', pending + approved)
+
+    def snapshot(self):
+        """現在の件数と、直前1分間・直近1時間のイベント数を返す"""
+        minute = int(time.time() // 60)
+        with self.lock:
+            last_minute = dict.fromkeys(self.EVENTS, 0)
+            last_hour = dict.fromkeys(self.EVENTS, 0)
+            for stamp, counts in self.buckets:
+                if stamp == minute - 1:
+                    last_minute = dict(counts)
+                if minute - self.WINDOW_MINUTES < stamp <= minute:
+                    for event in self.EVENTS:
+                        last_hour[event] += counts[event]
+            return {
+                "pending": self.pending,
+                "approved": self.approved,
+                "expired_total": self.expired_total,
+                "revoked_total": self.revoked_total,
+                "last_minute": last_minute,
+                "last_hour": last_hour,
+            }
+
+AUTH_STATS = AuthStats()
+
+@profiled('db.init_db')
 def init_db():
     """データベースの初期化とテーブルの作成"""
     try:
         with DB_LOCK:
             with sqlite3.connect(DATABASE_FILE) as conn:
                 cursor = conn.cursor()
+                # WAL: 読み取りが書き込みトランザクションを待たない (DBファイルに永続化される設定)
+                cursor.execute("PRAGMA journal_mode=WAL")
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS auth_data (
                         ip_address TEXT PRIMARY KEY,
                         auth_id TEXT UNIQUE,
                         is_authenticated INTEGER DEFAULT 0,
-                        expires_at TEXT
+                        expires_at TEXT,
+                        approved_by TEXT,
+                        approved_at TEXT
                     )
                 """)
+                # 既存DBの移行: 承認者・承認日時の列を追加
+                cursor.execute("PRAGMA table_info(auth_data)")
+                columns = {row[1] for row in cursor.fetchall()}
+                for column in ('approved_by', 'approved_at'):
+                    if column not in columns:
+                        cursor.execute(f"ALTER TABLE auth_data ADD COLUMN {column} TEXT")
+                # 移行前の承認は承認日時が未記録のため、有効期限 (承認の7日後) から復元する
+                # (承認者は復元できないため、承認者での取り消しでは対象外になる)
+                cursor.execute("""
+                    UPDATE auth_data SET approved_at = datetime(expires_at, '-7 days')
+                    WHERE is_authenticated = 1 AND approved_at IS NULL
+                """)
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS settings (
                         key TEXT PRIMARY KEY,
                         value TEXT
                     )
                 """)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_auth_data_expires_at ON auth_data (expires_at)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_auth_data_approved_by ON auth_data (approved_by)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_auth_data_approved_at ON auth_data (approved_at)")
+                conn.commit()
+
+                # 停止中に期限切れになったレコードを先に削除する
+                # (残したまま初期化すると、後のpurgeで未計上の件数を差し引いてカウンタが負になる)
+                now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                cursor.execute("DELETE FROM auth_data WHERE expires_at <= ?", (now_str,))
+                if cursor.rowcount:
+                    logger.info(f"Purged {cursor.rowcount} auth record(s) that expired while offline.")
                 conn.commit()
+
+                # 統計カウンタを現在の有効なレコード数で初期化 (起動時の1回のみ)
+                cursor.execute("""
+                    SELECT is_authenticated, COUNT(*) FROM auth_data
+                    WHERE expires_at > ? GROUP BY is_authenticated
+                """, (now_str,))
+                counts = dict(cursor.fetchall())
+                AUTH_STATS.seed(counts.get(0, 0), counts.get(1, 0))
         logger.info("Database initialized successfully.")
     except sqlite3.Error as e:
         logger.error(f"Database initialization failed: {e}")
 
+@profiled('db.get_setting')
 def get_setting(key):
     """設定値を取得"""
     with DB_LOCK:
@@ -471,6 +459,7 @@ def get_setting(key):
             logger.error(f"Error fetching setting '{key}': {e}")
             return None
 
+@profiled('db.set_setting')
 def set_setting(key, value):
     """設定値を保存"""
     with DB_LOCK:
@@ -482,6 +471,7 @@ def set_setting(key, value):
         except sqlite3.Error as e:
             logger.error(f"Error saving setting '{key}': {e}")
 
+@profiled('db.generate_auth_id')
 def generate_auth_id(ip_address):
     """認証IDを自動生成し、IPを登録/更新"""
     auth_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
@@ -496,63 +486,84 @@ def generate_auth_id(ip_address):
                 if check_auth_status(ip_address):
                      return None
                 
+                # 期限内の承認待ちコードを置き換える場合は承認待ち件数を増やさない
+                cursor.execute("SELECT 1 FROM auth_data WHERE ip_address = ?", (ip_address,))
+                is_new = cursor.fetchone() is None
+
                 cursor.execute("""
                     INSERT OR REPLACE INTO auth_data (ip_address, auth_id, is_authenticated, expires_at)
                     VALUES (?, ?, 0, ?)
                 """, (ip_address, auth_id, expires_at))
                 conn.commit()
+                AUTH_STATS.record_generated(is_new)
                 return auth_id
         except sqlite3.Error as e:
             logger.error(f"Error generating auth ID for IP {ip_address}: {e}")
             return None
 
+@profiled('db.check_auth_status')
 def check_auth_status(ip_address):
-    """認証状態を確認"""
-    with DB_LOCK:
-        try:
-            with sqlite3.connect(DATABASE_FILE) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT is_authenticated, expires_at FROM auth_data WHERE ip_address = ?", (ip_address,))
-                result = cursor.fetchone()
-                if result:
-                    is_authenticated, expires_at_str = result
-                    expires_at = datetime.datetime.strptime(expires_at_str, '%Y-%m-%d %H:%M:%S')
-
-                    # 認証済みかつ期限内
-                    if is_authenticated == 1 and expires_at > datetime.datetime.now():
-                        return True
-                    
-                    # 未認証だが期限切れの場合、レコードを削除してFalseを返す
-                    if expires_at <= datetime.datetime.now() and is_authenticated == 0:
-                         cursor.execute("DELETE FROM auth_data WHERE ip_address = ? AND is_authenticated = 0", (ip_address,))
-                         conn.commit()
-                         return False
-                    
-                    return False
+    """認証状態を確認
+
+    WALモードでは読み取りが書き込みトランザクションを待たないため、参照はDB_LOCKを取らずに行う
+    (一括取り消し等の長い書き込み中も /check_auth が止まらない)。DB_LOCKは期限切れの削除時のみ取得する。
+    """
+    try:
+        with sqlite3.connect(DATABASE_FILE) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT is_authenticated, expires_at FROM auth_data WHERE ip_address = ?", (ip_address,))
+            result = cursor.fetchone()
+            if not result:
                 return False
-        except sqlite3.Error as e:
-            logger.error(f"Error checking auth status for IP {ip_address}: {e}")
+            is_authenticated, expires_at_str = result
+            expires_at = datetime.datetime.strptime(expires_at_str, '%Y-%m-%d %H:%M:%S')
+
+            # 認証済みかつ期限内
+            if is_authenticated == 1 and expires_at > datetime.datetime.now():
+                return True
+
+            # 期限切れの場合、レコードを削除してFalseを返す
+            # (承認済みの期限切れも削除し、期限切れイベントを1回だけ記録する)
+            if expires_at <= datetime.datetime.now():
+                with DB_LOCK:
+                    # 読み取り後に再発行・承認されたレコードは消さない
+                    cursor.execute(
+                        "DELETE FROM auth_data WHERE ip_address = ? AND expires_at = ?",
+                        (ip_address, expires_at_str)
+                    )
+                    conn.commit()
+                if cursor.rowcount:
+                    if is_authenticated == 1:
+                        AUTH_STATS.record_expired(approved=1)
+                    else:
+                        AUTH_STATS.record_expired(pending=1)
             return False
+    except sqlite3.Error as e:
+        logger.error(f"Error checking auth status for IP {ip_address}: {e}")
+        return False
 
-def approve_ip_by_id(auth_id):
-    """Discordからの認証コード承認処理"""
+@profiled('db.approve_ip_by_id')
+def approve_ip_by_id(auth_id, approved_by=None):
+    """Discordからの認証コード承認処理 (approved_byは承認者のDiscordユーザーID)"""
     with DB_LOCK:
         try:
             with sqlite3.connect(DATABASE_FILE) as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT ip_address FROM auth_data WHERE auth_id = ?", (auth_id,))
+                cursor.execute("SELECT ip_address, is_authenticated FROM auth_data WHERE auth_id = ?", (auth_id,))
                 result = cursor.fetchone()
 
                 if result:
-                    ip_address = result[0]
+                    ip_address, is_authenticated = result
                     # 認証成功。有効期限を7日間に延長
-                    new_expires_at = (datetime.datetime.now() + datetime.timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+                    now = datetime.datetime.now()
+                    new_expires_at = (now + datetime.timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
                     cursor.execute("""
                         UPDATE auth_data 
-                        SET is_authenticated = 1, expires_at = ?
+                        SET is_authenticated = 1, expires_at = ?, approved_by = ?, approved_at = ?
                         WHERE auth_id = ?
-                    """, (new_expires_at, auth_id))
+                    """, (new_expires_at, approved_by, now.strftime('%Y-%m-%d %H:%M:%S'), auth_id))
                     conn.commit()
+                    AUTH_STATS.record_approved(was_pending=is_authenticated == 0)
                     logger.info(f"Auth approved for IP: {ip_address} using code: {auth_id}")
                     return ip_address
                 return None
@@ -560,11 +571,156 @@ def approve_ip_by_id(auth_id):
             logger.error(f"Error approving auth ID {auth_id}: {e}")
             return None
 
+@profiled('db.purge_expired_auth')
+def purge_expired_auth():
+    """期限切れのレコードをまとめて削除し、統計に反映"""
+    now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with DB_LOCK:
+        try:
+            with sqlite3.connect(DATABASE_FILE) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT is_authenticated, COUNT(*) FROM auth_data
+                    WHERE expires_at <= ? GROUP BY is_authenticated
+                """, (now_str,))
+                counts = dict(cursor.fetchall())
+                cursor.execute("DELETE FROM auth_data WHERE expires_at <= ?", (now_str,))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error purging expired auth data: {e}")
+            return
+    AUTH_STATS.record_expired(pending=counts.get(0, 0), approved=counts.get(1, 0))
+
+@profiled('db.revoke_auth')
+def revoke_auth(ip_address=None, auth_id=None, approved_by=None, approved_since=None, approved_until=None):
+    """条件に一致する認証を1トランザクションの一括DELETEで取り消し、件数を返す (失敗時はNone)
+
+    承認日時の範囲は approved_since 以上 approved_until 未満 (いずれもサーバーのローカル時刻)。
+    """
+    conditions = []
+    params = []
+    if ip_address:
+        conditions.append("ip_address = ?")
+        params.append(ip_address)
+    if auth_id:
+        conditions.append("auth_id = ?")
+        params.append(auth_id)
+    if approved_by:
+        conditions.append("approved_by = ?")
+        params.append(approved_by)
+    if approved_since:
+        conditions.append("approved_at >= ?")
+        params.append(approved_since.strftime('%Y-%m-%d %H:%M:%S'))
+    if approved_until:
+        conditions.append("approved_at < ?")
+        params.append(approved_until.strftime('%Y-%m-%d %H:%M:%S'))
+
+    # 条件なしの全件削除は誤操作防止のため行わない
+    if not conditions:
+        return 0
+    where = " AND ".join(conditions)
+
+    with DB_LOCK:
+        try:
+            with sqlite3.connect(DATABASE_FILE) as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(f"SELECT is_authenticated, COUNT(*) FROM auth_data WHERE {where} GROUP BY is_authenticated", params)
+                counts = dict(cursor.fetchall())
+                cursor.execute(f"DELETE FROM auth_data WHERE {where}", params)
+                revoked = cursor.rowcount
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error revoking auth ({where}): {e}")
+            return None
+
+    # レコードを削除するため、次の /check_auth から即座に未認証として扱われる
+    AUTH_STATS.record_revoked(pending=counts.get(0, 0), approved=counts.get(1, 0))
+    logger.info(f"Revoked {revoked} auth record(s) where {where} {params}")
+    return revoked
+
+@profiled('db.count_approvals_without_approver')
+def count_approvals_without_approver():
+    """承認者が記録されていない有効な承認 (承認者記録の導入前の承認) の件数を返す"""
+    try:
+        with sqlite3.connect(DATABASE_FILE) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM auth_data WHERE is_authenticated = 1 AND approved_by IS NULL")
+            return cursor.fetchone()[0]
+    except sqlite3.Error as e:
+        logger.error(f"Error counting approvals without approver: {e}")
+        return 0
+
 # ==============================================================================
-# 3. Flask サーバー設定
+# 4. Flask サーバー設定
 # ==============================================================================
 
-app = Flask(__name__)
+# static/ はビルド出力で、/ と /assets/ から配信するため、Flask標準の /static/ ルートは無効にする
+app = Flask(__name__, static_folder=None)
+
+# 認証ページのアセット (assets/ が正本のソース、static/ が build_assets.py の出力)
+ASSET_SOURCE_DIR = os.path.join(app.root_path, 'assets')
+ASSET_BUILD_DIR = os.path.join(app.root_path, 'static')
+ASSET_DIST_DIR = os.path.join(ASSET_BUILD_DIR, 'dist')
+# フィンガープリント付きアセットのキャッシュ期間 (1年)
+ASSET_MAX_AGE = 31536000
+
+class WebMetrics:
+    """Waitressの処理待ちキューの深さと待ち時間を集計する (スレッドセーフ)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.served = 0
+        self.shed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        # パーセンタイル計算用の直近の待ち時間 (秒)
+        self.recent_waits = collections.deque(maxlen=1000)
+
+    def record_enqueue(self, depth, shed):
+        with self.lock:
+            self.queue_depth = depth
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            if shed:
+                self.shed += 1
+
+    def record_wait(self, depth, wait):
+        with self.lock:
+            self.queue_depth = depth
+            self.served += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.recent_waits.append(wait)
+
+    def snapshot(self):
+        with self.lock:
+            waits = sorted(self.recent_waits)
+            def percentile(q):
+                return waits[min(len(waits) - 1, int(len(waits) * q))] * 1000 if waits else 0.0
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "queue_limit": WEB_MAX_QUEUE,
+                "priority_queue_limit": WEB_MAX_PRIORITY_QUEUE,
+                "threads": WEB_THREADS,
+                "served": self.served,
+                "shed": self.shed,
+                "wait_ms_avg": (self.total_wait / self.served * 1000) if self.served else 0.0,
+                "wait_ms_p50": percentile(0.50),
+                "wait_ms_p95": percentile(0.95),
+                "wait_ms_max": self.max_wait * 1000,
+            }
+
+WEB_METRICS = WebMetrics()
+
+def is_admin_request(req):
+    """管理用トークンが一致するかを確認 (ADMIN_TOKEN未設定時は常にFalse)"""
+    return bool(ADMIN_TOKEN) and req.headers.get('X-Admin-Token') == ADMIN_TOKEN
+
+if PROFILE_ENABLED:
+    PROFILER.install(app)
 
 def get_client_ip(req):
     """プロキシ環境から真のクライアントIPを取得 (Render対応)"""
@@ -575,8 +731,26 @@ def get_client_ip(req):
 
 @app.route('/')
 def index():
-    """index.htmlの代わりに認証ページを表示"""
-    return render_template_string(AUTH_HTML_TEMPLATE)
+    """認証ページを表示 (ビルド済みならminify版、未ビルドならソースをそのまま配信)"""
+    if os.path.isfile(os.path.join(ASSET_BUILD_DIR, 'index.html')):
+        response = send_from_directory(ASSET_BUILD_DIR, 'index.html', max_age=0)
+    else:
+        response = send_from_directory(ASSET_SOURCE_DIR, 'index.html', max_age=0)
+    # HTMLは毎回再検証させ、参照先のアセットURLの更新を即座に反映する
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/assets/<path:filename>')
+def api_assets(filename):
+    """CSS/JS/フォントを配信 (フィンガープリント付きはimmutableで長期キャッシュ)"""
+    if os.path.isfile(os.path.join(ASSET_DIST_DIR, filename)):
+        response = send_from_directory(ASSET_DIST_DIR, filename, max_age=ASSET_MAX_AGE)
+        response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+        return response
+    # 未ビルド時はソースをキャッシュさせずに配信
+    response = send_from_directory(ASSET_SOURCE_DIR, filename, max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/generate_id', methods=['GET'])
 def api_generate_id():
@@ -613,11 +787,39 @@ def api_authenticated_content():
     logger.warning(f"Access denied to unauthenticated IP: {ip_address}")
     return "認証が必要です。", 403
 
+@app.route('/metrics', methods=['GET'])
+def api_metrics():
+    """Webサーバーのキュー深さと待ち時間を返す (管理者用)"""
+    if not is_admin_request(request):
+        return "Not Found", 404
+    metrics = WEB_METRICS.snapshot()
+    metrics["bot"] = BOT_SUPERVISOR.snapshot() if BOT_SUPERVISOR else None
+    return jsonify(metrics), 200
+
+@app.route('/admin/profile', methods=['GET'])
+def api_admin_profile():
+    """区間タイマーと保存済みプロファイルの一覧を返す (管理者用)"""
+    if not is_admin_request(request):
+        return "Not Found", 404
+    return jsonify(PROFILER.snapshot()), 200
+
+@app.route('/admin/profile/collapsed', methods=['GET'])
+def api_admin_profile_collapsed():
+    """遅いリクエストのスタックをcollapsed-stack形式で返す (flamegraph.pl / speedscope 用)"""
+    if not is_admin_request(request):
+        return "Not Found", 404
+    return PROFILER.collapsed(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
 
 # ==============================================================================
-# 4. Discord Bot 設定 (エラー処理強化)
+# 5. Discord Bot 設定 (エラー処理強化)
 # ==============================================================================
 
+def parse_admin_datetime(text):
+    """管理コマンドの日時 (ADMIN_TIMEZONE の 'YYYY-MM-DD HH:MM') をDBと同じサーバーのローカル時刻に変換"""
+    parsed = datetime.datetime.strptime(text, '%Y-%m-%d %H:%M')
+    return parsed.replace(tzinfo=ADMIN_TIMEZONE).astimezone().replace(tzinfo=None)
+
 # 認証コード入力用モーダルフォーム
 class AuthCodeModal(ui.Modal, title="認証コード承認"):
     code_input = ui.TextInput(
@@ -636,7 +838,7 @@ class AuthCodeModal(ui.Modal, title="認証コード承認"):
     async def on_submit(self, interaction: Interaction):
         code = self.code_input.value.upper()
         
-        ip_address = approve_ip_by_id(code)
+        ip_address = approve_ip_by_id(code, str(interaction.user.id))
         
         if ip_address:
             embed = Embed(
@@ -647,18 +849,7 @@ class AuthCodeModal(ui.Modal, title="認証コード承認"):
             embed.set_footer(text=f"実行者: {interaction.user.display_name} ({interaction.user.id})")
             
             # ログチャンネルへの通知
-            log_channel_id = get_setting('log_channel_id')
-            if log_channel_id:
-                try:
-                    log_channel = self.bot.get_channel(int(log_channel_id))
-                    if log_channel:
-                        await log_channel.send(embed=embed)
-                    else:
-                         logger.warning(f"Log channel ID {log_channel_id} not found/cached.")
-                except ValueError:
-                    logger.error(f"Invalid log channel ID stored: {log_channel_id}")
-                except Exception as e:
-                    logger.error(f"Failed to send log message: {e}")
+            await self.bot.send_log(embed)
 
             await interaction.response.send_message("✅ 認証が完了しました。ユーザーの画面が切り替わります。", ephemeral=True)
         else:
@@ -677,30 +868,79 @@ class AuthCodeView(ui.View):
 
 
 class MyBot(commands.Bot):
-    def __init__(self):
+    def __init__(self, supervisor=None):
         intents = discord.Intents.default()
         intents.message_content = True 
         intents.members = True 
         
         super().__init__(command_prefix='!', intents=intents)
+        # 再接続の成否を通知する監視役 (BotSupervisor)
+        self.supervisor = supervisor
         
     async def setup_hook(self):
         """Botの準備完了後に実行される処理"""
         # 永続Viewの追加
         self.add_view(AuthCodeView(self))
+
+        # 期限切れレコードの定期削除 (承認待ちのまま放置されたコードも統計に反映)
+        if not self.purge_expired_task.is_running():
+            self.purge_expired_task.start()
         
         # コマンドツリーの同期
         try:
             self.tree.add_command(self.set_log_channel)
             self.tree.add_command(self.approve_code_slash)
+            self.tree.add_command(self.auth_stats_slash)
+            self.tree.add_command(self.revoke_auth_slash)
             
+            # 💡 再起動のたびにグローバル同期しないよう、定義が変わった時だけ同期する
+            payload = json.dumps([cmd.to_dict(self.tree) for cmd in self.tree.get_commands()], sort_keys=True)
+            commands_hash = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+            if get_setting('command_sync_hash') == commands_hash:
+                logger.info("Slash commands unchanged. Skipping global sync.")
+                return
+
             synced_commands = await self.tree.sync()
+            set_setting('command_sync_hash', commands_hash)
             logger.info(f"Synced {len(synced_commands)} slash commands globally.")
         except Exception as e:
             logger.error(f"Failed to sync slash commands: {e}")
 
     async def on_ready(self):
         logger.info(f'Logged in as {self.user} (ID: {self.user.id})')
+        if self.supervisor:
+            self.supervisor.mark_ready()
+
+    async def on_resumed(self):
+        if self.supervisor:
+            self.supervisor.mark_ready()
+
+    async def on_disconnect(self):
+        if self.supervisor:
+            self.supervisor.mark_disconnected()
+
+    async def send_log(self, embed):
+        """設定済みのログチャンネルへEmbedを送信"""
+        log_channel_id = get_setting('log_channel_id')
+        if log_channel_id:
+            try:
+                log_channel = self.get_channel(int(log_channel_id))
+                if log_channel:
+                    await log_channel.send(embed=embed)
+                else:
+                     logger.warning(f"Log channel ID {log_channel_id} not found/cached.")
+            except ValueError:
+                logger.error(f"Invalid log channel ID stored: {log_channel_id}")
+            except Exception as e:
+                logger.error(f"Failed to send log message: {e}")
+
+    async def close(self):
+        self.purge_expired_task.cancel()
+        await super().close()
+
+    @tasks.loop(minutes=1)
+    async def purge_expired_task(self):
+        await asyncio.to_thread(purge_expired_auth)
 
     # --- Discord コマンド ---
 
@@ -723,6 +963,104 @@ class MyBot(commands.Bot):
             ephemeral=False
         )
         
+    @app_commands.command(name="認証統計", description="認証コードの件数と直近のレートを表示します。")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def auth_stats_slash(self, interaction: Interaction):
+        stats = AUTH_STATS.snapshot()
+        last_minute = stats['last_minute']
+        last_hour = stats['last_hour']
+        embed = Embed(title="📊 認証統計", color=discord.Color.blurple())
+        embed.add_field(name="承認待ち", value=f"{stats['pending']} 件")
+        embed.add_field(name="承認済み (有効)", value=f"{stats['approved']} 件")
+        embed.add_field(name="期限切れ (起動後累計)", value=f"{stats['expired_total']} 件")
+        embed.add_field(name="取り消し (起動後累計)", value=f"{stats['revoked_total']} 件")
+        embed.add_field(
+            name="直前1分間",
+            value=f"発行 {last_minute['generated']} / 承認 {last_minute['approved']} / 期限切れ {last_minute['expired']} / 取り消し {last_minute['revoked']}",
+            inline=False
+        )
+        embed.add_field(
+            name="直近1時間",
+            value=f"発行 {last_hour['generated']} / 承認 {last_hour['approved']} / 期限切れ {last_hour['expired']} / 取り消し {last_hour['revoked']}",
+            inline=False
+        )
+        if self.supervisor:
+            bot_stats = self.supervisor.snapshot()
+            if bot_stats['recoveries']:
+                recovery = f"{bot_stats['recoveries']} 回 / 直近 {bot_stats['recovery_s_last']:.1f}秒 / 最大 {bot_stats['recovery_s_max']:.1f}秒"
+            else:
+                recovery = "なし"
+            embed.add_field(name="Bot再接続 (起動後)", value=recovery, inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="認証取り消し", description="条件に一致する認証を即座に取り消します。")
+    @app_commands.describe(
+        ipアドレス="このIPアドレスの認証を取り消す",
+        コード="この認証コードの認証を取り消す",
+        承認者="このユーザーが承認した認証をすべて取り消す",
+        開始="この日時以降に承認された認証を取り消す (日本時間。例: 2025-01-31 12:00)",
+        終了="この日時 (この1分間を含む) までに承認された認証を取り消す (日本時間。例: 2025-01-31 18:00)"
+    )
+    @app_commands.checks.has_permissions(administrator=True)
+    async def revoke_auth_slash(
+        self,
+        interaction: Interaction,
+        ipアドレス: str = None,
+        コード: str = None,
+        承認者: discord.User = None,
+        開始: str = None,
+        終了: str = None
+    ):
+        try:
+            approved_since = parse_admin_datetime(開始) if 開始 else None
+            # 終了は分単位で入力されるため、その1分間の承認も含める (DB側は「未満」で比較)
+            approved_until = parse_admin_datetime(終了) + datetime.timedelta(minutes=1) if 終了 else None
+        except ValueError:
+            await interaction.response.send_message("❌ 日時は `YYYY-MM-DD HH:MM` の形式で入力してください。", ephemeral=True)
+            return
+
+        if not (ipアドレス or コード or 承認者 or approved_since or approved_until):
+            await interaction.response.send_message("❌ 取り消し条件を1つ以上指定してください。", ephemeral=True)
+            return
+
+        # 大量削除は3秒の応答期限を超えうるため、先に応答を保留してから別スレッドで実行
+        await interaction.response.defer(ephemeral=True)
+        revoked = await asyncio.to_thread(
+            revoke_auth,
+            ip_address=ipアドレス,
+            auth_id=コード.upper() if コード else None,
+            approved_by=str(承認者.id) if 承認者 else None,
+            approved_since=approved_since,
+            approved_until=approved_until
+        )
+        if revoked is None:
+            await interaction.followup.send("❌ 取り消し中にエラーが発生しました。", ephemeral=True)
+            return
+
+        conditions = []
+        if ipアドレス:
+            conditions.append(f"IP: `{ipアドレス}`")
+        if コード:
+            conditions.append(f"コード: `{コード.upper()}`")
+        if 承認者:
+            conditions.append(f"承認者: {承認者.mention}")
+        if approved_since or approved_until:
+            conditions.append(f"承認日時: {開始 or '…'} 〜 {終了 or '…'} ({ADMIN_TIMEZONE.key})")
+        if 承認者:
+            # 承認者の記録を導入する前の承認は承認者で絞り込めないため、件数を知らせる
+            unattributed = await asyncio.to_thread(count_approvals_without_approver)
+            if unattributed:
+                conditions.append(f"⚠️ 承認者が記録されていない承認 {unattributed} 件は対象外です。IPかコードで取り消してください。")
+
+        embed = Embed(
+            title="🚫 認証を取り消しました",
+            description=f"{revoked} 件の認証を取り消しました。\n" + "\n".join(conditions),
+            color=discord.Color.red()
+        )
+        embed.set_footer(text=f"実行者: {interaction.user.display_name} ({interaction.user.id})")
+        await self.send_log(embed)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+        
     async def on_app_command_error(self, interaction: Interaction, error: app_commands.AppCommandError):
         if isinstance(error, app_commands.MissingPermissions):
             await interaction.response.send_message("❌ このコマンドを実行する権限がありません。", ephemeral=True)
@@ -733,50 +1071,295 @@ class MyBot(commands.Bot):
 
 
 # ==============================================================================
-# 5. サーバー/Bot 起動ロジック 💡【最重要修正箇所】
+# 6. サーバー/Bot 起動ロジック 💡【最重要修正箇所】
 # ==============================================================================
 
+class ServiceUnavailable(WaitressError):
+    """キューが満杯の時に返す503エラー"""
+    code = 503
+    reason = "Service Unavailable"
+
+    def to_response(self, ident=None):
+        status, headers, body = super().to_response(ident)
+        headers.append(("Retry-After", "1"))
+        return status, headers, body
+
+
+class QueuedChannel:
+    """キュー投入時刻を保持し、待ち時間を計測するためのラッパー"""
+    __slots__ = ('channel', 'queue', 'enqueued_at', 'priority')
+
+    def __init__(self, channel, queue, priority=False):
+        self.channel = channel
+        self.queue = queue
+        self.enqueued_at = time.monotonic()
+        # 通常リクエストより前の優先領域に置かれるか
+        self.priority = priority
+
+    def service(self):
+        WEB_METRICS.record_wait(len(self.queue), time.monotonic() - self.enqueued_at)
+        self.channel.service()
+
+    def cancel(self):
+        self.channel.cancel()
+
+
+class AdmissionDispatcher(ThreadedTaskDispatcher):
+    """処理待ちキューに上限と優先度を設けたWaitressのタスクディスパッチャー
+
+    上限を超えたリクエストは専用の503スレッドで応答するため、ワーカーが全て
+    遅いリクエストで埋まっていても待たされずに503を受け取れる。
+    """
+
+    def __init__(self):
+        super().__init__()
+        # 503を返すエラータスクのキュー (ワーカーのキューとは別に、専用スレッドで処理)
+        self.shed_queue = collections.deque()
+        self.shed_cv = threading.Condition(self.lock)
+        self.shed_thread = None
+        self.shed_stopping = False
+        # 過負荷時にログが溢れないよう、503の件数をまとめて出力する
+        self.shed_unlogged = 0
+        self.shed_logged_at = None
+
+    def set_thread_count(self, count):
+        super().set_thread_count(count)
+        with self.lock:
+            if count > 0 and self.shed_thread is None:
+                self.shed_stopping = False
+                self.shed_thread = threading.Thread(target=self.shed_handler_thread, name="waitress-shed", daemon=True)
+                self.shed_thread.start()
+
+    def shed_handler_thread(self):
+        """503のエラータスクだけを処理する (アプリを実行しないため、すぐに終わる)"""
+        while True:
+            with self.lock:
+                while not self.shed_queue and not self.shed_stopping:
+                    self.shed_cv.wait()
+                if self.shed_stopping:
+                    break
+                channel = self.shed_queue.popleft()
+            try:
+                channel.service()
+            except BaseException:
+                self.logger.exception("Exception when servicing %r", channel)
+
+    def shutdown(self, cancel_pending=True, timeout=5):
+        with self.lock:
+            self.shed_stopping = True
+            self.shed_cv.notify_all()
+            if cancel_pending:
+                while self.shed_queue:
+                    self.shed_queue.popleft().cancel()
+        return super().shutdown(cancel_pending=cancel_pending, timeout=timeout)
+
+    def add_task(self, channel):
+        # channel.requests はWaitress側でロック済みの状態で渡される
+        request = channel.requests[0] if channel.requests else None
+        priority = request is not None and request.path in WEB_PRIORITY_PATHS
+
+        with self.lock:
+            # キューは 優先リクエスト (到着順) + 通常リクエスト の順に並ぶ
+            waiting_priority = 0
+            for queued in self.queue:
+                if not queued.priority:
+                    break
+                waiting_priority += 1
+            waiting_normal = len(self.queue) - waiting_priority
+
+            if priority:
+                full = waiting_priority >= WEB_MAX_PRIORITY_QUEUE
+            else:
+                full = waiting_normal >= WEB_MAX_QUEUE
+            shed = full and request is not None and not request.error
+
+            log_count = 0
+            if shed:
+                # 💡 キューが満杯: アプリを実行せず、専用スレッドで即座に503を返す
+                request.error = ServiceUnavailable("Server is busy. Please retry shortly.")
+                self.shed_queue.append(channel)
+                self.shed_cv.notify()
+
+                self.shed_unlogged += 1
+                now = time.monotonic()
+                if self.shed_logged_at is None or now - self.shed_logged_at >= WEB_SHED_LOG_INTERVAL:
+                    log_count = self.shed_unlogged
+                    self.shed_unlogged = 0
+                    self.shed_logged_at = now
+            else:
+                task = QueuedChannel(channel, self.queue, priority=priority)
+                if priority:
+                    # 優先リクエスト同士は到着順を保ち、通常リクエストより前へ
+                    self.queue.insert(waiting_priority, task)
+                else:
+                    self.queue.append(task)
+                self.queue_cv.notify()
+            depth = len(self.queue)
+
+        WEB_METRICS.record_enqueue(depth, shed)
+        if log_count:
+            logger.warning(f"Request queue full (depth {depth}). Shed {log_count} request(s) with 503 since last report.")
+
+
 def run_flask_server():
     """Flaskサーバーを別スレッドで起動 (waitressを使用)"""
     # Renderは環境変数PORTを提供するため、それを使用
     port = int(os.environ.get('PORT', 8000)) 
-    logger.info(f"Starting Flask server using Waitress on http://0.0.0.0:{port}")
+    logger.info(
+        f"Starting Flask server using Waitress on http://0.0.0.0:{port} "
+        f"(threads={WEB_THREADS}, connection_limit={WEB_CONNECTION_LIMIT}, "
+        f"channel_timeout={WEB_CHANNEL_TIMEOUT}s, max_queue={WEB_MAX_QUEUE})"
+    )
     try:
         # 💡 waitressを使ってサーバーを起動 (Production推奨)
-        # threadsはデフォルトの4で十分です
-        serve(app, host='0.0.0.0', port=port) 
+        # キュー上限付きのディスパッチャーを使い、DB待ちで全リクエストが詰まらないようにする
+        dispatcher = AdmissionDispatcher()
+        dispatcher.set_thread_count(WEB_THREADS)
+        server = create_server(
+            app,
+            host='0.0.0.0',
+            port=port,
+            threads=WEB_THREADS,
+            connection_limit=WEB_CONNECTION_LIMIT,
+            channel_timeout=WEB_CHANNEL_TIMEOUT,
+            _dispatcher=dispatcher,
+        )
+        server.run()
     except Exception as e:
         logger.error(f"Flask server error: {e}")
 
-# main.py の 749行目付近
+class BotSupervisor:
+    """単一のイベントループ上でBotを監視し、ジッター付き指数バックオフで再接続する"""
+
+    def __init__(self, token):
+        self.token = token
+        self.bot = None
+        self.consecutive_failures = 0
+        self.failed_at = None
+        # 直近の復旧所要時間 (秒)
+        self.recovery_times = collections.deque(maxlen=50)
+
+    def mark_disconnected(self):
+        """on_disconnectから呼ばれる。discord.py内部のRESUMEによる復旧も計測の対象にする"""
+        if self.failed_at is None:
+            self.failed_at = time.monotonic()
+
+    def mark_ready(self):
+        """on_ready/on_resumedから呼ばれ、障害からの復旧時間を記録する"""
+        if self.failed_at is not None:
+            elapsed = time.monotonic() - self.failed_at
+            self.recovery_times.append(elapsed)
+            logger.info(f"Discord bot recovered in {elapsed:.1f}s after {self.consecutive_failures} supervised failure(s).")
+        self.failed_at = None
+        self.consecutive_failures = 0
+
+    def snapshot(self):
+        """復旧時間の統計を返す (/metrics と /認証統計 で使用)"""
+        times = list(self.recovery_times)
+        return {
+            "connected": self.failed_at is None,
+            "down_for_s": (time.monotonic() - self.failed_at) if self.failed_at is not None else 0.0,
+            "consecutive_failures": self.consecutive_failures,
+            "recoveries": len(times),
+            "recovery_s_last": times[-1] if times else None,
+            "recovery_s_avg": sum(times) / len(times) if times else None,
+            "recovery_s_max": max(times) if times else None,
+        }
 
-def run_bot(token):
-    """Discord Botの起動と再接続ループ (エラー対策)"""
-    while True:
-        bot = None
+    def get_retry_after(self, error):
+        """Discordが指定した待機秒数 (Retry-After) を取得。なければNone"""
+        if isinstance(error, discord.errors.RateLimited):
+            return error.retry_after
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        if headers and headers.get('Retry-After'):
+            try:
+                return float(headers['Retry-After'])
+            except ValueError:
+                return None
+        return None
+
+    def record_failure(self, error):
+        """失敗を記録し、次の再接続までの待機秒数を返す"""
+        if self.failed_at is None:
+            self.failed_at = time.monotonic()
+        self.consecutive_failures += 1
+
+        # 連続失敗が閾値に達したらサーキットを開き、クールダウンまで接続を試みない
+        if self.consecutive_failures >= BOT_CIRCUIT_THRESHOLD:
+            # 半開状態: クールダウン後の1回が失敗すれば再びサーキットを開く
+            self.consecutive_failures = BOT_CIRCUIT_THRESHOLD - 1
+            logger.error(f"Circuit breaker opened after repeated failures. Pausing reconnects for {BOT_CIRCUIT_COOLDOWN:.0f}s.")
+            return BOT_CIRCUIT_COOLDOWN
+
+        # Equal Jitter: 上限付き指数バックオフの半分〜全体からランダムに選ぶ
+        backoff = min(BOT_RETRY_MAX_DELAY, BOT_RETRY_BASE_DELAY * (2 ** (self.consecutive_failures - 1)))
+        delay = random.uniform(backoff / 2, backoff)
+
+        # 429などでRetry-Afterが返された場合は、その時間より早く再試行しない
+        retry_after = self.get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after + random.uniform(0, BOT_RETRY_BASE_DELAY))
+        return delay
+
+    async def run_once(self):
+        """Botを1回起動し、接続が終わるまで待機する"""
+        if self.bot is None or self.bot.is_closed():
+            self.bot = MyBot(supervisor=self)
+            try:
+                await self.bot.login(self.token)
+            except BaseException:
+                # ログイン失敗時はHTTPセッションを残さない
+                await self.bot.close()
+                raise
+        # 一時的な切断はdiscord.py側でHTTPセッションを保ったままRESUMEする
+        await self.bot.connect(reconnect=True)
+
+    async def run(self):
+        """Botの起動と再接続ループ (エラー対策)"""
         try:
-            bot = MyBot()
-            logger.info("Attempting to run Discord bot...")
-            # run()メソッドが失敗（切断/クラッシュ）するまでブロック
-            bot.run(token, reconnect=False) 
-        except discord.errors.LoginFailure:
-            logger.critical("Discord Token is invalid. Cannot log in. Aborting.")
-            break 
-        except discord.errors.HTTPException as e:
-             # 429エラーなど、Discord API起因のエラーを捕捉
-            logger.error(f"Discord API Error (Bot crash): {e}. Will retry in 30 seconds to respect rate limit.")
-            
-            # 💡 429エラー対策: Botオブジェクトのクローズはスキップし、長めの待機時間を設ける
-            # Bot.close()の呼び出しは、イベントループがないとエラーになるため削除
-            time.sleep(400) # 300秒待機に延長
-            
-        except Exception as e:
-            logger.error(f"Discord bot disconnected or crashed: {e}. Reconnecting in 10 seconds...")
-            # 💡 一般的なクラッシュ: 待機時間も10秒に延長
-            time.sleep(10) # ブロッキングスリープで確実に待機
+            while True:
+                error = None
+                try:
+                    logger.info("Attempting to run Discord bot...")
+                    await self.run_once()
+                    logger.warning("Discord bot connection closed. Restarting...")
+                except discord.errors.LoginFailure:
+                    logger.critical("Discord Token is invalid. Cannot log in. Aborting.")
+                    break
+                except Exception as e:
+                    error = e
+                    logger.error(f"Discord bot disconnected or crashed: {e}")
+
+                delay = self.record_failure(error)
+                logger.info(f"Reconnecting Discord bot in {delay:.1f}s.")
+                await asyncio.sleep(delay)
         finally:
-            # Botオブジェクトが残っていても、ループが再開される際に新しいオブジェクトが作成されるため問題なし
-            pass
+            if self.bot is not None and not self.bot.is_closed():
+                await self.bot.close()
+
+
+def build_assets_in_background():
+    """未ビルドの場合のみ、フロントエンドアセットのビルドを別スレッドで実行"""
+    if os.path.isfile(os.path.join(ASSET_BUILD_DIR, 'index.html')):
+        return
+
+    def build():
+        try:
+            import build_assets
+            build_assets.build()
+            logger.info("Frontend assets built. Serving the optimized auth page.")
+        except Exception as e:
+            logger.error(f"Frontend asset build failed. Serving the source auth page: {e}")
+
+    logger.info("Frontend assets are not built. Building in the background...")
+    threading.Thread(target=build, name="Asset-Build", daemon=True).start()
+
+
+def run_bot(token):
+    """Discord Botを単一の永続イベントループ上で起動"""
+    global BOT_SUPERVISOR
+    BOT_SUPERVISOR = BotSupervisor(token)
+    asyncio.run(BOT_SUPERVISOR.run())
 
 
 if __name__ == '__main__':
@@ -785,6 +1368,10 @@ if __name__ == '__main__':
     else:
         # 1. DB初期化
         init_db()
+
+        # 1.5 認証ページのアセットをビルド (デプロイ時にビルド済みならスキップ)
+        if BUILD_ASSETS_ON_START:
+            build_assets_in_background()
         
         # 2. Flaskサーバーをスレッドで起動
         flask_thread = threading.Thread(target=run_flask_server, name="Flask-Server")
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """テストごとに空のSQLiteファイルと統計カウンタを用意する"""
+    monkeypatch.setattr(main, 'DATABASE_FILE', str(tmp_path / 'ip_auth.db'))
+    monkeypatch.setattr(main, 'AUTH_STATS', main.AuthStats())
+    main.init_db()
+    return main.DATABASE_FILE
@@ -0,0 +1,164 @@
+import http.client
+import threading
+import time
+
+import pytest
+from waitress.server import create_server
+
+import main
+
+
+class StubRequest:
+    def __init__(self, path):
+        self.path = path
+        self.error = None
+
+
+class StubChannel:
+    """Waitressのチャネルの代わり (requests[0] と service/cancel だけを持つ)"""
+
+    def __init__(self, path):
+        self.requests = [StubRequest(path)]
+
+    @property
+    def request(self):
+        return self.requests[0]
+
+    def service(self):
+        pass
+
+    def cancel(self):
+        pass
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    """ワーカースレッドを起動しないディスパッチャー (キューの中身だけを検査する)"""
+    monkeypatch.setattr(main, 'WEB_MAX_QUEUE', 2)
+    monkeypatch.setattr(main, 'WEB_MAX_PRIORITY_QUEUE', 2)
+    monkeypatch.setattr(main, 'WEB_METRICS', main.WebMetrics())
+    return main.AdmissionDispatcher()
+
+
+def queued_paths(dispatcher):
+    return [task.channel.request.path for task in dispatcher.queue]
+
+
+def test_sheds_normal_requests_beyond_queue_limit(dispatcher):
+    channels = [StubChannel(f'/generate_id?{i}') for i in range(4)]
+    for channel in channels:
+        dispatcher.add_task(channel)
+
+    assert [c.request.error is None for c in channels] == [True, True, False, False]
+    assert isinstance(channels[2].request.error, main.ServiceUnavailable)
+    # 503はワーカーのキューに入らず、専用スレッドのキューへ
+    assert queued_paths(dispatcher) == ['/generate_id?0', '/generate_id?1']
+    assert list(dispatcher.shed_queue) == channels[2:]
+    assert main.WEB_METRICS.snapshot()['shed'] == 2
+
+
+def test_priority_requests_jump_ahead_in_arrival_order(dispatcher):
+    dispatcher.add_task(StubChannel('/generate_id'))
+    dispatcher.add_task(StubChannel('/check_auth'))
+    dispatcher.add_task(StubChannel('/'))
+    dispatcher.add_task(StubChannel('/check_auth'))
+
+    assert queued_paths(dispatcher) == ['/check_auth', '/check_auth', '/generate_id', '/']
+    first, second = dispatcher.queue[0], dispatcher.queue[1]
+    assert first.enqueued_at <= second.enqueued_at
+
+
+def test_priority_requests_have_their_own_cap(dispatcher):
+    for _ in range(2):
+        dispatcher.add_task(StubChannel('/generate_id'))
+    # 通常キューが満杯でも優先リクエストは別枠で受け付ける
+    priority = [StubChannel('/check_auth') for _ in range(3)]
+    for channel in priority:
+        dispatcher.add_task(channel)
+
+    assert [c.request.error is None for c in priority] == [True, True, False]
+    assert queued_paths(dispatcher) == ['/check_auth', '/check_auth', '/generate_id', '/generate_id']
+    assert list(dispatcher.shed_queue) == priority[2:]
+
+
+def test_shed_tasks_are_excluded_from_wait_metrics(dispatcher):
+    for i in range(3):
+        dispatcher.add_task(StubChannel(f'/generate_id?{i}'))
+    while dispatcher.queue:
+        dispatcher.queue.popleft().service()
+
+    assert main.WEB_METRICS.snapshot()['served'] == 2
+
+
+def test_shed_warning_is_rate_limited(dispatcher, monkeypatch, caplog):
+    monkeypatch.setattr(main, 'WEB_SHED_LOG_INTERVAL', 3600)
+    with caplog.at_level('WARNING', logger=main.logger.name):
+        for i in range(10):
+            dispatcher.add_task(StubChannel(f'/generate_id?{i}'))
+
+    warnings = [r for r in caplog.records if 'Shed' in r.getMessage()]
+    assert len(warnings) == 1
+    assert dispatcher.shed_unlogged == 7
+
+
+def test_shed_requests_get_503_while_every_worker_is_blocked(monkeypatch):
+    """実際のWaitressで、唯一のワーカーが遅いリクエストで埋まっていても503がすぐ返る"""
+    monkeypatch.setattr(main, 'WEB_MAX_QUEUE', 1)
+    monkeypatch.setattr(main, 'WEB_METRICS', main.WebMetrics())
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_app(environ, start_response):
+        started.set()
+        release.wait(10)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    dispatcher = main.AdmissionDispatcher()
+    dispatcher.set_thread_count(1)
+    server = create_server(slow_app, host='127.0.0.1', port=0, _dispatcher=dispatcher)
+    stop = threading.Event()
+
+    def serve():
+        # server.run() は別スレッドから安全に止められないため、停止フラグを見ながらループを回す
+        while not stop.is_set():
+            server.asyncore.loop(timeout=0.05, map=server._map, count=1)
+        server.close()
+
+    server_thread = threading.Thread(target=serve, daemon=True)
+    server_thread.start()
+    port = server.effective_port
+
+    def get(results):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        begin = time.monotonic()
+        conn.request('GET', '/generate_id')
+        response = conn.getresponse()
+        response.read()
+        results.append((response.status, time.monotonic() - begin))
+        conn.close()
+
+    clients = []
+    try:
+        blocked, queued, shed = [], [], []
+        clients = [threading.Thread(target=get, args=(results,), daemon=True) for results in (blocked, queued)]
+        clients[0].start()
+        assert started.wait(5)
+        clients[1].start()
+        deadline = time.monotonic() + 5
+        while not dispatcher.queue and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # ワーカー1つ・キュー1つが埋まった状態の3件目以降は503
+        for _ in range(3):
+            get(shed)
+        assert [status for status, _ in shed] == [503, 503, 503]
+        assert max(elapsed for _, elapsed in shed) < 0.5
+        assert not blocked and not queued
+    finally:
+        release.set()
+        for client in clients:
+            client.join(5)
+        stop.set()
+        server_thread.join(5)
+        dispatcher.shutdown(timeout=2)
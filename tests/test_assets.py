@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import build_assets
+import main
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+@pytest.fixture
+def built(tmp_path, monkeypatch):
+    """ビルド出力 (static/) の代わりの一時ディレクトリ"""
+    build_dir = tmp_path / 'static'
+    (build_dir / 'dist').mkdir(parents=True)
+    monkeypatch.setattr(main, 'ASSET_BUILD_DIR', str(build_dir))
+    monkeypatch.setattr(main, 'ASSET_DIST_DIR', str(build_dir / 'dist'))
+    return build_dir
+
+
+def test_index_serves_source_page_when_unbuilt(client, built):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert b'href="/assets/auth.css"' in response.data
+
+
+def test_index_serves_built_page(client, built):
+    (built / 'index.html').write_text('<!DOCTYPE html><p>built</p>\n', encoding='utf-8')
+    response = client.get('/')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert b'built' in response.data
+
+
+def test_fingerprinted_assets_are_immutable(client, built):
+    (built / 'dist' / 'auth.0123456789.css').write_text('body{}', encoding='utf-8')
+    response = client.get('/assets/auth.0123456789.css')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == f'public, max-age={main.ASSET_MAX_AGE}, immutable'
+
+
+def test_source_assets_fall_back_without_caching(client, built):
+    response = client.get('/assets/auth.css')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/assets/../main.py').status_code == 404
+
+
+def test_default_static_route_is_disabled(client):
+    assert client.get('/static/manifest.json').status_code == 404
+    assert client.get('/static/index.html').status_code == 404
+
+
+@pytest.mark.parametrize('html', [
+    '<script>alert(1)</script>',
+    '<style>p { color: red }</style>',
+    '<pre>a\n  b</pre>',
+])
+def test_minify_html_refuses_inline_whitespace_sensitive_content(html):
+    with pytest.raises(ValueError):
+        build_assets.minify_html(f'<body>\n  {html}\n</body>')
+
+
+def test_minify_html_keeps_external_scripts_and_inline_spacing():
+    html = '<head>\n  <script src="/a.js" defer></script>\n</head>\n<span>a</span>\n  <button>b</button>\n'
+    assert build_assets.minify_html(html) == (
+        '<head>\n<script src="/a.js" defer></script>\n</head>\n<span>a</span>\n<button>b</button>\n'
+    )
+
+
+def test_font_subset_text_excludes_main_py_messages():
+    chars = build_assets.collect_font_text('<p>認証</p>', '', '')
+    assert '認' in chars
+    # 認証後コンテンツの文字は含む
+    assert all(ch in chars for ch in '認証成功ようこそ')
+    # Discordコマンドの文言 (main.py内だがページには表示されない) は含まない
+    assert '権' not in chars and '件' not in chars
+
+
+@pytest.fixture
+def build_env(tmp_path, monkeypatch):
+    """assets/ のコピーと一時的な出力先でビルドする (ダウンロードは行わない)"""
+    source = tmp_path / 'assets'
+    shutil.copytree(os.path.join(build_assets.BASE_DIR, 'assets'), source, ignore=shutil.ignore_patterns('vendor'))
+    vendor = source / 'vendor'
+    vendor.mkdir()
+    static = tmp_path / 'static'
+    static.mkdir()
+    monkeypatch.setattr(build_assets, 'SOURCE_DIR', str(source))
+    monkeypatch.setattr(build_assets, 'VENDOR_DIR', str(vendor))
+    monkeypatch.setattr(build_assets, 'STATIC_DIR', str(static))
+    monkeypatch.setattr(build_assets, 'DIST_DIR', str(static / 'dist'))
+    monkeypatch.setattr(build_assets, 'CONFETTI_FILE', str(vendor / 'confetti.js'))
+    monkeypatch.setattr(build_assets, 'FONT_SOURCE_FILE', str(vendor / 'font.ttf'))
+    monkeypatch.setattr(build_assets, 'download', lambda url, path: os.path.exists(path))
+    return vendor, static
+
+
+def read_build(static):
+    html = (static / 'index.html').read_text(encoding='utf-8')
+    manifest = json.loads((static / 'manifest.json').read_text(encoding='utf-8'))
+    return html, manifest
+
+
+def test_build_rewrites_urls_to_self_hosted_assets(build_env, monkeypatch):
+    vendor, static = build_env
+    (vendor / 'confetti.js').write_text('window.confetti = function () {};\n', encoding='utf-8')
+    (vendor / 'font.ttf').write_bytes(b'stub font source')
+    monkeypatch.setattr(build_assets, 'subset_font', lambda chars: b'wOF2 stub subset')
+
+    build_assets.build()
+    html, manifest = read_build(static)
+
+    assert set(manifest) == {'auth.css', 'auth.js', 'vendor/confetti.js', 'vendor/noto-sans-jp.woff2'}
+    for name in manifest.values():
+        assert (static / 'dist' / name).is_file()
+    assert f'href="/assets/{manifest["auth.css"]}"' in html
+    assert f'src="/assets/{manifest["auth.js"]}"' in html
+    assert f'data-confetti-src="/assets/{manifest["vendor/confetti.js"]}"' in html
+    assert f'<link rel="preload" href="/assets/{manifest["vendor/noto-sans-jp.woff2"]}"' in html
+    assert 'fonts.googleapis.com' not in html and 'cdn.jsdelivr.net' not in html
+    css = (static / 'dist' / manifest['auth.css']).read_text(encoding='utf-8')
+    assert css.startswith('@font-face{') and f'url("{manifest["vendor/noto-sans-jp.woff2"]}")' in css
+
+
+def test_build_keeps_cdn_references_for_missing_assets(build_env, monkeypatch):
+    _, static = build_env
+    monkeypatch.setattr(build_assets, 'subset_font', lambda chars: None)
+
+    build_assets.build()
+    html, manifest = read_build(static)
+
+    assert set(manifest) == {'auth.css', 'auth.js'}
+    assert build_assets.CONFETTI_URL in html
+    assert build_assets.FONT_CDN_LINKS[1] in html
+    assert '/assets/vendor/' not in html
+    css = (static / 'dist' / manifest['auth.css']).read_text(encoding='utf-8')
+    assert '@font-face' not in css
@@ -0,0 +1,49 @@
+import datetime
+import sqlite3
+
+import main
+
+
+def insert_approvals(path, count, expires_at, prefix):
+    with sqlite3.connect(path) as conn:
+        conn.executemany(
+            "INSERT INTO auth_data (ip_address, auth_id, is_authenticated, expires_at, approved_by, approved_at)"
+            " VALUES (?, ?, 1, ?, 'admin', ?)",
+            [(f"{prefix}.{i}", f"{prefix}{i}", expires_at, expires_at) for i in range(count)],
+        )
+
+
+def timestamp(delta):
+    return (datetime.datetime.now() + delta).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def test_restart_with_expired_rows_keeps_counters_consistent(db, monkeypatch):
+    insert_approvals(db, 10, timestamp(datetime.timedelta(days=7)), '10.0.0')
+    insert_approvals(db, 5, timestamp(-datetime.timedelta(hours=1)), '10.0.1')
+
+    # 再起動: 新しいカウンタでDBを開き直す
+    monkeypatch.setattr(main, 'AUTH_STATS', main.AuthStats())
+    main.init_db()
+    assert main.AUTH_STATS.snapshot()['approved'] == 10
+
+    main.purge_expired_auth()
+    snapshot = main.AUTH_STATS.snapshot()
+    assert snapshot['approved'] == 10
+    assert snapshot['pending'] == 0
+
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM auth_data").fetchone()[0] == 10
+
+
+def test_counters_follow_generate_approve_and_revoke(db):
+    auth_id = main.generate_auth_id('192.0.2.1')
+    assert main.AUTH_STATS.snapshot()['pending'] == 1
+
+    assert main.approve_ip_by_id(auth_id, approved_by='1')
+    snapshot = main.AUTH_STATS.snapshot()
+    assert (snapshot['pending'], snapshot['approved']) == (0, 1)
+
+    assert main.revoke_auth(ip_address='192.0.2.1') == 1
+    snapshot = main.AUTH_STATS.snapshot()
+    assert (snapshot['approved'], snapshot['revoked_total']) == (0, 1)
+
@@ -0,0 +1,162 @@
+import asyncio
+
+import discord
+import pytest
+
+import main
+
+
+class StopGateway(BaseException):
+    """フェイクゲートウェイのシナリオ終了 (run() の except Exception を抜けるため BaseException)"""
+
+
+class FakeGateway:
+    """MyBotの代わりに、接続ごとに指定した障害を発生させるローカルのフェイクゲートウェイ"""
+
+    def __init__(self, login_failures=(), connect_failures=(), close_on_failure=False):
+        self.login_failures = list(login_failures)
+        self.connect_failures = list(connect_failures)
+        self.close_on_failure = close_on_failure
+        self.bots = []
+
+    def bot_class(self):
+        gateway = self
+
+        class FakeBot:
+            def __init__(self, supervisor=None):
+                self.supervisor = supervisor
+                self.closed = False
+                self.logins = 0
+                gateway.bots.append(self)
+
+            async def login(self, token):
+                self.logins += 1
+                if gateway.login_failures:
+                    raise gateway.login_failures.pop(0)
+
+            async def connect(self, reconnect=True):
+                if gateway.connect_failures:
+                    error = gateway.connect_failures.pop(0)
+                    if gateway.close_on_failure:
+                        self.closed = True
+                    raise error
+                self.supervisor.mark_ready()
+                raise StopGateway()
+
+            def is_closed(self):
+                return self.closed
+
+            async def close(self):
+                self.closed = True
+
+        return FakeBot
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """実際には待たずに、要求された待機秒数を記録する"""
+    recorded = []
+
+    async def fake_sleep(delay):
+        recorded.append(delay)
+
+    monkeypatch.setattr(main.asyncio, 'sleep', fake_sleep)
+    return recorded
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    monkeypatch.setattr(main, 'BOT_RETRY_BASE_DELAY', 1.0)
+    monkeypatch.setattr(main, 'BOT_RETRY_MAX_DELAY', 8.0)
+    monkeypatch.setattr(main, 'BOT_CIRCUIT_THRESHOLD', 100)
+    monkeypatch.setattr(main, 'BOT_CIRCUIT_COOLDOWN', 999.0)
+
+
+def run_supervisor(monkeypatch, gateway):
+    monkeypatch.setattr(main, 'MyBot', gateway.bot_class())
+    supervisor = main.BotSupervisor('token')
+    with pytest.raises(StopGateway):
+        asyncio.run(supervisor.run())
+    return supervisor
+
+
+def test_backoff_stays_within_exponential_bounds(settings):
+    supervisor = main.BotSupervisor('token')
+    for attempt in range(1, 8):
+        backoff = min(8.0, 2 ** (attempt - 1))
+        delay = supervisor.record_failure(OSError("gateway down"))
+        assert backoff / 2 <= delay <= backoff
+
+
+def test_retry_after_is_a_floor(settings):
+    supervisor = main.BotSupervisor('token')
+    delay = supervisor.record_failure(discord.errors.RateLimited(30.0))
+    assert 30.0 <= delay <= 31.0
+
+    class FakeResponse:
+        headers = {'Retry-After': '12'}
+
+    error = OSError("429")
+    error.response = FakeResponse()
+    assert 12.0 <= supervisor.record_failure(error) <= 13.0
+
+
+def test_circuit_opens_at_threshold_and_reopens_when_half_open(settings, monkeypatch):
+    monkeypatch.setattr(main, 'BOT_CIRCUIT_THRESHOLD', 3)
+    supervisor = main.BotSupervisor('token')
+    assert supervisor.record_failure(None) < 999.0
+    assert supervisor.record_failure(None) < 999.0
+    assert supervisor.record_failure(None) == 999.0
+    # クールダウン後の1回目が失敗したら即座に再びサーキットを開く
+    assert supervisor.record_failure(None) == 999.0
+
+
+def test_login_is_not_repeated_while_bot_is_open(settings, sleeps, monkeypatch):
+    gateway = FakeGateway(connect_failures=[OSError("drop")] * 3)
+    supervisor = run_supervisor(monkeypatch, gateway)
+
+    assert len(gateway.bots) == 1
+    assert gateway.bots[0].logins == 1
+    assert len(sleeps) == 3
+    assert supervisor.consecutive_failures == 0
+    assert len(supervisor.recovery_times) == 1
+    # run() を抜ける際にBotを閉じる
+    assert gateway.bots[0].closed
+
+
+def test_new_bot_is_built_after_client_was_closed(settings, sleeps, monkeypatch):
+    gateway = FakeGateway(connect_failures=[OSError("fatal")] * 2, close_on_failure=True)
+    run_supervisor(monkeypatch, gateway)
+
+    assert len(gateway.bots) == 3
+    assert [bot.logins for bot in gateway.bots] == [1, 1, 1]
+
+
+def test_failed_login_closes_bot_and_retries(settings, sleeps, monkeypatch):
+    gateway = FakeGateway(login_failures=[discord.errors.RateLimited(5.0)])
+    run_supervisor(monkeypatch, gateway)
+
+    assert len(gateway.bots) == 2
+    assert gateway.bots[0].closed
+    assert sleeps[0] >= 5.0
+
+
+def test_invalid_token_aborts(settings, sleeps, monkeypatch):
+    gateway = FakeGateway(login_failures=[discord.errors.LoginFailure()])
+    monkeypatch.setattr(main, 'MyBot', gateway.bot_class())
+    asyncio.run(main.BotSupervisor('token').run())
+
+    assert len(gateway.bots) == 1
+    assert sleeps == []
+
+
+def test_gateway_drop_recovery_is_recorded(settings):
+    supervisor = main.BotSupervisor('token')
+    supervisor.mark_disconnected()
+    assert not supervisor.snapshot()['connected']
+    supervisor.mark_ready()
+
+    stats = supervisor.snapshot()
+    assert stats['connected']
+    assert stats['recoveries'] == 1
+    assert stats['consecutive_failures'] == 0
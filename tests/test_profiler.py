@@ -0,0 +1,51 @@
+import threading
+
+import main
+
+
+def test_end_request_freezes_stacks_of_slow_request(monkeypatch):
+    monkeypatch.setattr(main, 'PROFILE_SLOW_MS', 0)
+    monkeypatch.setattr(main, 'PROFILE_SAMPLE_RATE', 0)
+    profiler = main.RequestProfiler()
+
+    with main.app.test_request_context('/check_auth'):
+        profiler.start_request()
+        entry = profiler.active[threading.get_ident()]
+        entry["stacks"]["app.py:wsgi_app"] += 3
+        profiler.end_request()
+
+    assert threading.get_ident() not in profiler.active
+    # サンプラーが古い参照を持っていても、保存済みの集計は変わらない
+    entry["stacks"]["app.py:wsgi_app"] += 1
+    (capture,) = profiler.slow_requests
+    assert capture["stacks"] == {"app.py:wsgi_app": 3}
+    assert profiler.collapsed() == "/check_auth;app.py:wsgi_app 3\n"
+
+
+def test_timers_are_keyed_by_route_not_raw_path(monkeypatch):
+    monkeypatch.setattr(main, 'PROFILE_SAMPLE_RATE', 0)
+    profiler = main.RequestProfiler()
+
+    for path in ('/assets/auth.css', '/assets/auth.js', '/wp-login.php', '/.env', '/check_auth'):
+        with main.app.test_request_context(path):
+            profiler.start_request()
+            profiler.end_request()
+
+    assert set(profiler.timers) == {
+        'request /assets/<path:filename>',
+        'request <unmatched>',
+        'request /check_auth',
+    }
+    assert profiler.timers['request <unmatched>'][0] == 2
+
+
+def test_admin_endpoints_are_not_profiled():
+    profiler = main.RequestProfiler()
+
+    for path in ('/metrics', '/admin/profile'):
+        with main.app.test_request_context(path):
+            profiler.start_request()
+            assert not profiler.active
+            profiler.end_request()
+
+    assert not profiler.timers
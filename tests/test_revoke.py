@@ -0,0 +1,106 @@
+import datetime
+import sqlite3
+import threading
+
+import pytest
+
+import main
+
+
+def approve(path, ip_address, approved_by, approved_at, auth_id=None):
+    """承認済みレコードを直接作成 (approved_at はサーバーのローカル時刻)"""
+    expires_at = approved_at + datetime.timedelta(days=7)
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "INSERT INTO auth_data (ip_address, auth_id, is_authenticated, expires_at, approved_by, approved_at)"
+            " VALUES (?, ?, 1, ?, ?, ?)",
+            (
+                ip_address,
+                auth_id or ip_address.replace('.', ''),
+                expires_at.strftime('%Y-%m-%d %H:%M:%S'),
+                approved_by,
+                approved_at.strftime('%Y-%m-%d %H:%M:%S'),
+            ),
+        )
+
+
+def remaining(path):
+    with sqlite3.connect(path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT ip_address FROM auth_data"))
+
+
+@pytest.fixture
+def now():
+    return datetime.datetime.now().replace(second=0, microsecond=0)
+
+
+def test_revoke_by_code(db, now):
+    approve(db, '192.0.2.1', '1', now, auth_id='ABC123')
+    approve(db, '192.0.2.2', '1', now, auth_id='XYZ789')
+
+    assert main.revoke_auth(auth_id='ABC123') == 1
+    assert remaining(db) == ['192.0.2.2']
+
+
+def test_revoke_by_approver(db, now):
+    approve(db, '192.0.2.1', '1', now)
+    approve(db, '192.0.2.2', '1', now)
+    approve(db, '192.0.2.3', '2', now)
+
+    assert main.revoke_auth(approved_by='1') == 2
+    assert remaining(db) == ['192.0.2.3']
+    assert main.AUTH_STATS.snapshot()['revoked_total'] == 2
+
+
+def test_revoke_window_includes_both_bounds(db, now):
+    start = now - datetime.timedelta(hours=2)
+    end = now - datetime.timedelta(hours=1)
+    approve(db, '192.0.2.1', '1', start - datetime.timedelta(seconds=1))
+    approve(db, '192.0.2.2', '1', start)
+    # 終了の1分間 (HH:MM:00〜HH:MM:59) の承認も含む
+    approve(db, '192.0.2.3', '1', end + datetime.timedelta(seconds=59))
+    approve(db, '192.0.2.4', '1', end + datetime.timedelta(minutes=1))
+
+    since = main.parse_admin_datetime(start.astimezone(main.ADMIN_TIMEZONE).strftime('%Y-%m-%d %H:%M'))
+    until = main.parse_admin_datetime(end.astimezone(main.ADMIN_TIMEZONE).strftime('%Y-%m-%d %H:%M'))
+    assert since == start
+    assert main.revoke_auth(approved_since=since, approved_until=until + datetime.timedelta(minutes=1)) == 2
+    assert remaining(db) == ['192.0.2.1', '192.0.2.4']
+
+
+def test_parse_admin_datetime_converts_to_server_local_time():
+    parsed = main.parse_admin_datetime('2025-01-31 12:00')
+    expected = datetime.datetime(2025, 1, 31, 12, 0, tzinfo=main.ADMIN_TIMEZONE).astimezone().replace(tzinfo=None)
+    assert parsed == expected
+
+
+def test_migration_backfills_approved_at_for_legacy_rows(db, now):
+    expires_at = now + datetime.timedelta(days=3)
+    with sqlite3.connect(db) as conn:
+        conn.execute(
+            "INSERT INTO auth_data (ip_address, auth_id, is_authenticated, expires_at) VALUES ('192.0.2.9', 'OLD001', 1, ?)",
+            (expires_at.strftime('%Y-%m-%d %H:%M:%S'),),
+        )
+    main.init_db()
+
+    with sqlite3.connect(db) as conn:
+        approved_at, = conn.execute("SELECT approved_at FROM auth_data WHERE auth_id = 'OLD001'").fetchone()
+    assert approved_at == (expires_at - datetime.timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+    assert main.count_approvals_without_approver() == 1
+
+
+def test_check_auth_does_not_wait_for_write_transaction(db, now):
+    approve(db, '192.0.2.1', '1', now)
+
+    # 一括取り消しと同じく、DB_LOCKを保持したまま書き込みトランザクションを開いておく
+    with main.DB_LOCK, sqlite3.connect(db) as writer:
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute("DELETE FROM auth_data WHERE ip_address = '192.0.2.1'")
+        result = []
+        thread = threading.Thread(target=lambda: result.append(main.check_auth_status('192.0.2.1')))
+        thread.start()
+        thread.join(timeout=2)
+        assert not thread.is_alive()
+        # 未コミットの削除は見えない
+        assert result == [True]
+        writer.rollback()